@@ -0,0 +1,121 @@
+"""Benchmark of MessageCategorizer backends: fastText and TF-IDF + LinearSVC
+
+Every line of texts file is json with text and optional label (afs, other or ps).
+Accuracy of TF-IDF backend is reported against predictions of fastText (the serving model) always,
+and accuracy of both backends against labels if labels are given.
+
+    $ python benchmark_backends.py
+    $ python benchmark_backends.py --texts labeled.jsonl --repeat 1 --batch-size 64
+
+Inference is timed on messages preprocessed by pipeline of backend, end-to-end time includes preprocessing.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from project.ml.message_categorization import MessageCategorizer
+
+corpus_path = 'project/ml/storage/text_preprocessing/golden_corpus.jsonl'
+
+backends = {
+    'fasttext': 'project/ml/storage/message_categorizer/fasttext.ftz',
+    'tfidf_svm': 'project/ml/storage/message_categorizer_tfidf_svm/multiclf.npz',
+}
+
+labels = ['afs', 'other', 'ps']
+
+# predictions of reference backend are used as labels of the others
+reference_backend = 'fasttext'
+
+
+def run_backend(model_path, texts, batch_size):
+    model = MessageCategorizer(model_path=model_path)
+
+    start = time.perf_counter()
+    preprocessed = [model.preprocessor.preprocess(x) for x in texts]
+    preprocessing_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for x in preprocessed:
+        model.model.predict_proba(x)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prediction = np.concatenate([
+        model.model.predict_proba_batch(preprocessed[i:i + batch_size]) for i in range(0, len(texts), batch_size)
+    ])
+    batch_seconds = time.perf_counter() - start
+
+    return prediction.argmax(axis=1), {
+        'preprocessing_per_s': round(len(texts) / preprocessing_seconds),
+        'single_per_s': round(len(texts) / single_seconds),
+        'batch_per_s': round(len(texts) / batch_seconds),
+        'end_to_end_batch_per_s': round(len(texts) / (preprocessing_seconds + batch_seconds)),
+    }
+
+
+def compare(predicted, reference):
+    """Get accuracy of predictions against reference ones, recall of every reference category and confusion matrix
+
+    Notes
+    ----------
+
+    Example output:
+
+        $ comparison = {'accuracy': 0.93, 'recall': {'afs': 0.95, 'other': 0.8, 'ps': 0.96},
+                        'confusion': {'afs': {'afs': 19, 'other': 0, 'ps': 1}, ...}}
+
+    Rows of confusion matrix are reference categories, columns are predicted ones.
+    """
+    return {
+        'accuracy': round(float((predicted == reference).mean()), 4),
+        'recall': {
+            label: round(float((predicted[reference == i] == i).mean()), 4) if (reference == i).any() else None
+            for i, label in enumerate(labels)
+        },
+        'confusion': {
+            label: {other: int(((reference == i) & (predicted == j)).sum()) for j, other in enumerate(labels)}
+            for i, label in enumerate(labels)
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', default=corpus_path)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    with open(args.texts, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip() != ''] * args.repeat
+
+    texts = [item['text'] for item in corpus]
+    expected = np.array([labels.index(item['label']) if 'label' in item else -1 for item in corpus])
+
+    results = {}
+    predicted = {}
+
+    for name, model_path in backends.items():
+        predicted[name], results[name] = run_backend(os.path.abspath(model_path), texts, args.batch_size)
+
+        if (expected >= 0).any():
+            results[name]['accuracy'] = round(float((predicted[name] == expected)[expected >= 0].mean()), 4)
+
+    for name in backends:
+        if name != reference_backend:
+            results[name][f'vs_{reference_backend}'] = compare(predicted[name], predicted[reference_backend])
+
+    print(json.dumps({
+        'texts': len(texts),
+        'labeled': int((expected >= 0).sum()),
+        'backends': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
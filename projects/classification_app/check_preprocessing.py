@@ -0,0 +1,46 @@
+"""Record expected results of default preprocessing pipeline to golden corpus
+
+Every line of corpus is json with text and expected result, tests/test_preprocessing.py checks that
+compiled and step by step pipelines give expected results. Expected results were recorded by the original
+step by step ``TextPreprocessor`` with offline translation, update them only when pipeline is changed on purpose.
+
+    $ python -m pytest tests/test_preprocessing.py   # compare compiled, stepwise and expected results
+    $ python check_preprocessing.py --update         # record results of stepwise pipeline as expected
+"""
+
+import json
+import sys
+
+from project.ml.text_preprocessing import TextPreprocessor
+
+corpus_path = 'project/ml/storage/text_preprocessing/golden_corpus.jsonl'
+
+
+def update():
+    preprocessor = TextPreprocessor()
+
+    with open(corpus_path, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip() != '']
+
+    changed = 0
+    for item in corpus:
+        expected = preprocessor.preprocess_stepwise(item['text'])
+
+        if item.get('expected') != expected:
+            changed += 1
+            print(json.dumps({**item, 'stepwise': expected}, ensure_ascii=False))
+
+        item['expected'] = expected
+
+    with open(corpus_path, 'w', encoding='utf-8') as f:
+        for item in corpus:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    print(f'{len(corpus)} texts, {changed} expected results changed')
+
+
+if __name__ == '__main__':
+    if '--update' not in sys.argv[1:]:
+        sys.exit(__doc__)
+
+    update()
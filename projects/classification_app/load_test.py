@@ -0,0 +1,103 @@
+"""Load test of categorize_message endpoint to compare serving setups
+
+Run the same test against every setup, e.g. gunicorn (sync) and uvicorn (async):
+
+    $ gunicorn -w 4 --preload -b 127.0.0.1:8000 app:app
+    $ python load_test.py --url http://127.0.0.1:8000 --concurrency 64 --duration 30
+
+    $ uvicorn asgi:app --host 127.0.0.1 --port 8001
+    $ python load_test.py --url http://127.0.0.1:8001 --concurrency 64 --duration 30
+
+Non-english messages are sent with --share-non-english to include translation into the test,
+set TRANSLATION_BACKEND=textblob to the servers to test slow network translation.
+"""
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+path = '/api/v1/support_department/categorize_message'
+
+english_messages = [
+    'hello xsolla, i have problems with epic store payments',
+    'where is my refund? I paid 20$ yesterday',
+    'I can\'t log in to my account',
+    'game key not received after payment',
+]
+
+non_english_messages = [
+    'Привет, у меня проблема с оплатой',
+    'ich habe ein Problem mit der Zahlung',
+    'no recibí mi reembolso, ¿dónde está?',
+]
+
+
+def run_client(url, deadline, share_non_english, latencies, errors, lock):
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+
+    while time.monotonic() < deadline:
+        messages = non_english_messages if random.random() < share_non_english else english_messages
+        # unique suffix not to measure prediction cache only
+        body = json.dumps({'user_message': f'{random.choice(messages)} {random.randrange(10 ** 9)}'})
+
+        start = time.perf_counter()
+        try:
+            connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except Exception:
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+            ok = False
+
+        with lock:
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(1)
+
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--share-non-english', type=float, default=0.2)
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.monotonic() + args.duration
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(run_client, url, deadline, args.share_non_english, latencies, errors, lock)
+
+    latencies.sort()
+
+    def percentile(q):
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000 if len(latencies) > 0 else 0
+
+    print(json.dumps({
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / args.duration, 1),
+        'p50_ms': round(percentile(0.5), 1),
+        'p90_ms': round(percentile(0.9), 1),
+        'p99_ms': round(percentile(0.99), 1),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,96 @@
 later on used at the very top level stories.py module to initiate the
 application with a specific config file"""
 
+import gc
+import os
+
 # Flask Imports
 from flask import Flask
 
+from project.utils.logging import setup_queue_logging
+from project.utils.metrics import Metrics, init_metrics, temporary_metrics_dir
+
 
 def create_app():
     app = Flask(__name__)
 
+    # max number of messages in one request to batch endpoints
+    app.config['MAX_BATCH_SIZE'] = int(os.getenv('MAX_BATCH_SIZE', 100))
+
+    # opt-in dynamic batching of concurrent requests to categorize_message,
+    # it needs threaded server e.g. gunicorn -w 4 --threads 8 app:app
+    app.config['MICRO_BATCHING'] = os.getenv('MICRO_BATCHING', '0') == '1'
+    app.config['MICRO_BATCH_MAX_SIZE'] = int(os.getenv('MICRO_BATCH_MAX_SIZE', 32))
+    app.config['MICRO_BATCH_MAX_WAIT_MS'] = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', 5))
+
+    # LRU cache of predictions by raw and preprocessed message, 0 size turns it off,
+    # optional SQLite file is shared by all workers of the server
+    app.config['PREDICTION_CACHE_SIZE'] = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+    app.config['PREDICTION_CACHE_PATH'] = os.getenv('PREDICTION_CACHE_PATH')
+    app.config['PREDICTION_CACHE_DISK_SIZE'] = int(os.getenv('PREDICTION_CACHE_DISK_SIZE', 100000))
+
+    # backend of translate preprocessing step: offline (no translation) or textblob (network),
+    # optional SQLite file persists translations, short ASCII messages with english words skip language detection
+    app.config['TRANSLATION_BACKEND'] = os.getenv('TRANSLATION_BACKEND', 'offline')
+    app.config['TRANSLATION_CACHE_PATH'] = os.getenv('TRANSLATION_CACHE_PATH')
+    app.config['TRANSLATION_MAX_ASCII_LENGTH'] = int(os.getenv('TRANSLATION_MAX_ASCII_LENGTH', 100))
+
+    # models are loaded from storage/{key}/{version} files, the most recently modified file is the latest version,
+    # it's checked every MODEL_RELOAD_INTERVAL seconds (0 turns reloading off) and replaces the previous one
+    # without restart, MODEL_MAX_VERSIONS limits number of loaded versions requested by model_version,
+    # MODEL_KEY picks directory of models: message_categorizer (fasttext) or message_categorizer_tfidf_svm
+    app.config['MODEL_KEY'] = os.getenv('MODEL_KEY', 'message_categorizer')
+    app.config['MODEL_STORAGE_PATH'] = os.getenv('MODEL_STORAGE_PATH')
+    app.config['MODEL_RELOAD_INTERVAL'] = float(os.getenv('MODEL_RELOAD_INTERVAL', 60))
+    app.config['MODEL_MAX_VERSIONS'] = int(os.getenv('MODEL_MAX_VERSIONS', 2))
+
+    # share of requests profiled step by step, 0 turns profiling off
+    app.config['PROFILING_SAMPLE_RATE'] = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))
+
+    # executors of async app: translation awaits in io executor, preprocessing and inference run in cpu executor
+    app.config['ASGI_CPU_WORKERS'] = int(os.getenv('ASGI_CPU_WORKERS', os.cpu_count()))
+    app.config['ASGI_IO_WORKERS'] = int(os.getenv('ASGI_IO_WORKERS', 32))
+
+    # share of info records (e.g. per-request records) to log, warnings and errors are always logged
+    app.config['LOG_SAMPLE_RATE'] = float(os.getenv('LOG_SAMPLE_RATE', 1))
+
+    # directory where every worker flushes its metrics, so /metrics of any worker sums all of them,
+    # default is a new temp directory of this process (shared by workers forked by gunicorn --preload)
+    # removed at its exit, empty value keeps metrics of the serving process only
+    app.config['METRICS_DIR'] = os.getenv('METRICS_DIR')
+    if app.config['METRICS_DIR'] is None:
+        app.config['METRICS_DIR'] = temporary_metrics_dir()
+
+    # load all resources and run dummy predictions at startup instead of the first requests
+    app.config['WARM_UP'] = os.getenv('WARM_UP', '1') == '1'
+
+    # file and client handlers are called by background thread, requests only put records to queue
+    setup_queue_logging(app.logger, sample_rate=app.config['LOG_SAMPLE_RATE'])
+
+    # request counters and latency histograms by endpoint, exposed at /metrics in Prometheus text format
+    app.extensions['metrics'] = Metrics(path=app.config['METRICS_DIR'] or None)
+    init_metrics(app, app.extensions['metrics'])
+
     from project.main import main as main_blueprint
     from project.api import api as api_blueprint
 
     app.register_blueprint(main_blueprint)
     app.register_blueprint(api_blueprint, url_prefix='/api/v1')
 
+    if app.config['WARM_UP']:
+        from project.api.support_department import warm_up
+
+        with app.app_context():
+            warm_up()
+
+        # with gunicorn --preload workers share loaded objects copy-on-write,
+        # frozen objects are not touched by gc of workers, so their memory pages stay shared
+        gc.freeze()
+
     return app
+
+
+def create_asgi_app():
+    from project.asgi import AsgiApp
+
+    return AsgiApp(create_app())
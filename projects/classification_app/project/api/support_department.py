@@ -1,11 +1,36 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
 from flask import jsonify, request, current_app
 from ..ml.message_categorization import MessageCategorizer
+from ..ml.micro_batching import MicroBatcher
+from ..ml.model_registry import ModelRegistry
+from ..ml.prediction_cache import PredictionCache
+from ..ml.profiling import StepProfiler
+from ..ml.translation import Translator, translation_backends
+from ..ml import text_preprocessing
+from ..ml import startup
 
 from . import api
 
-# TODO create time-depend key-accessible model storage as util
+# created on the first request by MODEL_* config, it loads models and reloads the latest version
+registry_mc = None
+
+# created on the first request if MICRO_BATCHING config is on
+batcher_mc = None
+
+# created on the first request by TRANSLATION_* config
+translator_mc = None
 
-model_mc = MessageCategorizer()
+# created on the first loaded model if PROFILING_SAMPLE_RATE config is positive
+profiler_mc = None
+
+# guards creation of objects above, concurrent first requests must not create them twice
+singletons_lock = threading.Lock()
 
 
 @api.route('/support_department/categorize_message', methods=['POST'])
@@ -16,6 +41,8 @@ def categorize_message():
         ----------
         user_message: str, required
             text data to calculate prediction
+        model_version: str, optional
+            version of model to predict by, the latest version by default
 
         Returns
         -------
@@ -34,15 +61,18 @@ def categorize_message():
             $ correct_request = {'user_message': 'hello xsolla, i have problems with epic store payments'}
             $ empty_request = ''
             $ wrong_key_request = {'wrong_key': 'hello xsolla, i have problems with epic store payments'}
+            $ wrong_version_request = {'user_message': 'hello', 'model_version': 'unknown'}
 
         Example output:
 
             $ {"message":"ok","prediction":[0.9648057818412781,0.035207804292440414,1.6475680240546353e-05]}
             $ {"message":"expected data in json","prediction":-1}
             $ {"message":"expected user_message field","prediction":-1}
+            $ {"message":"unknown model version","prediction":-1}
 
     """
-    current_app.logger.info('request: categorize user message')
+    start = time.perf_counter()
+    message_length = None
 
     # default prediction is -1 if something wrong
     response = {'message': 'ok', 'prediction': -1}
@@ -53,8 +83,14 @@ def categorize_message():
             data = request.get_json(force=True)
 
             if 'user_message' in data:
-                # get final prediction like 3-components 1d-array of floats
-                response['prediction'] = model_mc.predict_proba(data['user_message'])
+                message_length = len(data['user_message'])
+
+                if _unknown_version(data.get('model_version')):
+                    status = 404
+                    response['message'] = 'unknown model version'
+                else:
+                    # get final prediction like 3-components 1d-array of floats
+                    response['prediction'] = _predictor(data.get('model_version')).predict_proba(data['user_message'])
             else:
                 status = 404
                 response['message'] = 'expected user_message field'
@@ -63,10 +99,407 @@ def categorize_message():
             response['message'] = 'expected data in json'
 
     except Exception as e:
-        current_app.logger.info(f'exception: {e}')
+        current_app.logger.warning(f'exception: {e}')
+        response['message'] = 'bad'
+        status = 500
+
+    current_app.logger.info('request: categorize user message', extra={
+        'status': status,
+        'latency_ms': (time.perf_counter() - start) * 1000,
+        'message_length': message_length,
+        'predicted_class': _predicted_class(response['prediction'])
+    })
+
+    response = jsonify(response)
+
+    return response, status
+
+
+@api.route('/support_department/categorize_messages', methods=['POST'])
+def categorize_messages():
+    """Method to predict category probability of batch of input-messages, where prediction = [afs, other, ps]
+
+        Parameters
+        ----------
+        messages: list of dict, required
+            items with fields id (any json value) and user_message (str),
+            max number of items is set by MAX_BATCH_SIZE config
+        model_version: str, optional
+            version of model to predict by, the latest version by default
+
+        Returns
+        -------
+        message
+            str represented calculation result
+            `ok` if batch is processed, `error` otherwise
+        predictions
+            list of results in order of messages, every result has fields
+            id, message (`ok` or error of the item) and prediction (like in categorize_message)
+
+        Notes
+        ----------
+
+        Example input:
+
+            $ correct_request = {'messages': [{'id': 1, 'user_message': 'i have problems with epic store payments'},
+                                              {'id': 2, 'wrong_key': 'hello'}]}
+            $ wrong_key_request = {'wrong_key': []}
+
+        Example output:
+
+            $ {"message":"ok","predictions":[{"id":1,"message":"ok","prediction":[1.0,0.0,0.0]},
+                                             {"id":2,"message":"expected user_message field","prediction":-1}]}
+            $ {"message":"expected messages field","predictions":[]}
+
+    """
+    start = time.perf_counter()
+
+    response = {'message': 'ok', 'predictions': []}
+    status = 200
+
+    max_batch_size = current_app.config['MAX_BATCH_SIZE']
+
+    try:
+        data = request.get_json(force=True) if request.get_data() != b'' else None
+
+        if data is None:
+            status = 404
+            response['message'] = 'expected data in json'
+        elif not isinstance(data.get('messages'), list):
+            status = 404
+            response['message'] = 'expected messages field'
+        elif len(data['messages']) > max_batch_size:
+            status = 404
+            response['message'] = f'expected at most {max_batch_size} messages'
+        elif _unknown_version(data.get('model_version')):
+            status = 404
+            response['message'] = 'unknown model version'
+        else:
+            response['predictions'] = _categorize_items(data['messages'], data.get('model_version'))
+
+    except Exception as e:
+        current_app.logger.warning(f'exception: {e}')
         response['message'] = 'bad'
         status = 500
 
+    current_app.logger.info('request: categorize batch of user messages', extra={
+        'status': status,
+        'latency_ms': (time.perf_counter() - start) * 1000,
+        'batch_size': len(response['predictions']),
+        'predicted_classes': [_predicted_class(p['prediction']) for p in response['predictions']]
+    })
+
     response = jsonify(response)
 
     return response, status
+
+
+@api.route('/support_department/batching_metrics', methods=['GET'])
+def batching_metrics():
+    """Method to get achieved batch sizes of micro-batching in this worker
+
+        Returns
+        -------
+        message
+            `ok` if micro-batching is on, `micro-batching is off` otherwise
+        metrics
+            number of batches and messages, mean batch size and histogram of batch sizes
+
+        Notes
+        ----------
+
+        Example output:
+
+            $ {"message":"ok","metrics":{"batch_sizes":{"1":10,"4":25},"max_batch_size":32,"max_wait_ms":5.0,
+                                         "mean_batch_size":3.14,"num_of_batches":35,"num_of_messages":110}}
+
+    """
+    if batcher_mc is None:
+        return jsonify({'message': 'micro-batching is off', 'metrics': {}}), 200
+
+    return jsonify({'message': 'ok', 'metrics': batcher_mc.metrics()}), 200
+
+
+@api.route('/support_department/cache_metrics', methods=['GET'])
+def cache_metrics():
+    """Method to get hit and miss counters of prediction cache of the latest model version in this worker
+
+        Returns
+        -------
+        message
+            `ok` if prediction cache is on, `prediction cache is off` otherwise
+        metrics
+            hits by level (memory, disk), misses, hit rate, evictions and size of memory cache
+
+        Notes
+        ----------
+
+        Example output:
+
+            $ {"message":"ok","metrics":{"evictions":0,"hit_rate":0.42,"hits":{"disk":12,"memory":30},
+                                         "max_size":10000,"misses":58,"size":116}}
+
+    """
+    cache = _model().cache
+
+    if cache is None:
+        return jsonify({'message': 'prediction cache is off', 'metrics': {}}), 200
+
+    return jsonify({'message': 'ok', 'metrics': cache.stats()}), 200
+
+
+@api.route('/support_department/profiling_metrics', methods=['GET'])
+def profiling_metrics():
+    """Method to get per-step profile of sampled preprocessing and predictions in this worker
+
+        Returns
+        -------
+        message
+            `ok` if profiling is on, `profiling is off` otherwise
+        metrics
+            dict of step name to number of sampled calls, total and mean time
+            and histograms of time (ms), input and output lengths
+
+        Notes
+        ----------
+
+        Example output:
+
+            $ {"message":"ok","metrics":{"tokenize":{"count":12,"mean_ms":0.26,"total_ms":3.1,
+                                                     "time_ms":{"0.01":0,"0.05":0,"0.1":0,"0.5":11,"1":1,...},
+                                                     "input_length":{...},"output_length":{...}},...}}
+
+    """
+    if profiler_mc is None:
+        return jsonify({'message': 'profiling is off', 'metrics': {}}), 200
+
+    return jsonify({'message': 'ok', 'metrics': profiler_mc.stats()}), 200
+
+
+@api.route('/support_department/startup_metrics', methods=['GET'])
+def startup_metrics():
+    """Method to get load time of every resource at startup of this worker
+
+        Returns
+        -------
+        message
+            `ok` if all resources are loaded, `failed to load some resources` otherwise
+        timings
+            load time in seconds of every resource
+        errors
+            error of every resource failed to load
+
+        Notes
+        ----------
+
+        Example output:
+
+            $ {"errors":{},"message":"ok","timings":{"dummy_predictions":0.07,"fasttext_model":0.02,
+                                                    "langdetect_profiles":0.35,"nltk_punkt":0.41,"spelling_index":2.61}}
+
+    """
+    message = 'ok' if len(startup.startup_errors) == 0 else 'failed to load some resources'
+
+    return jsonify({'message': message, 'timings': startup.startup_timings, 'errors': startup.startup_errors}), 200
+
+
+@api.route('/support_department/model_metrics', methods=['GET'])
+def model_metrics():
+    """Method to get versions of models in storage and memory of loaded ones in this worker
+
+        Returns
+        -------
+        message
+            `ok`
+        metrics
+            dict of model key to its latest loaded version, versions in storage from the oldest one
+            and file size, memory growth of worker (bytes) and time of loading of every loaded version
+
+        Notes
+        ----------
+
+        Example output:
+
+            $ {"message":"ok","metrics":{"message_categorizer":{"latest":"fasttext","versions":["fasttext"],
+                                         "loaded":{"fasttext":{"file_size":2010395,"load_seconds":0.02,
+                                                               "loaded_at":1760000000.0,"memory":7311360,
+                                                               "prepare_seconds":0.41}}}}}
+
+    """
+    _model()
+
+    return jsonify({'message': 'ok', 'metrics': registry_mc.stats()}), 200
+
+
+def warm_up():
+    """Load the latest model with lazy resources and dummy predictions and create objects configured by app config"""
+    # warm-up runs in gunicorn master with --preload, models are reloaded by workers only
+    _model(start=False)
+
+    for resource, seconds in startup.startup_timings.items():
+        current_app.logger.info(f'startup: {resource} loaded in {seconds:.3f}s')
+
+    for resource, error in startup.startup_errors.items():
+        current_app.logger.warning(f'startup: {resource} failed to load: {error}')
+
+
+def _model(version=None, start=True):
+    global translator_mc
+
+    if translator_mc is None:
+        with singletons_lock:
+            if translator_mc is None:
+                translator_mc = Translator(
+                    backend=translation_backends[current_app.config['TRANSLATION_BACKEND']](),
+                    cache_path=current_app.config['TRANSLATION_CACHE_PATH'],
+                    max_ascii_length=current_app.config['TRANSLATION_MAX_ASCII_LENGTH']
+                )
+                text_preprocessing.translator = translator_mc
+
+    return _registry().get(current_app.config['MODEL_KEY'], version, start=start)
+
+
+def _registry():
+    global registry_mc
+
+    if registry_mc is None:
+        with singletons_lock:
+            if registry_mc is None:
+                registry_mc = ModelRegistry(
+                    _load_model,
+                    path=current_app.config['MODEL_STORAGE_PATH'],
+                    reload_interval=current_app.config['MODEL_RELOAD_INTERVAL'],
+                    max_versions=current_app.config['MODEL_MAX_VERSIONS'],
+                    # prepare is called by reloading thread too, so it gets app instead of app context
+                    prepare=functools.partial(_prepare_model, current_app._get_current_object())
+                )
+
+    return registry_mc
+
+
+def _load_model(key, version, path):
+    # registry measures memory and time of deserialization only, warm-up is done by _prepare_model
+    return MessageCategorizer(model_path=path)
+
+
+def _prepare_model(app, key, version, path, model):
+    global profiler_mc
+
+    # every version is warmed up before requests get it, warm-up of the first one also loads
+    # process-wide resources (nltk, langdetect), so it isn't counted as cost of model by registry,
+    # dummy predictions are made before cache, profiler and metrics are set not to count them
+    if app.config['WARM_UP']:
+        startup.warm_up(model)
+
+    if profiler_mc is None and app.config['PROFILING_SAMPLE_RATE'] > 0:
+        with singletons_lock:
+            if profiler_mc is None:
+                profiler_mc = StepProfiler(sample_rate=app.config['PROFILING_SAMPLE_RATE'])
+
+    model.preprocessor.profiler = profiler_mc
+
+    if app.config['PREDICTION_CACHE_SIZE'] > 0:
+        # predictions of versions are different, so every version has its own entries in shared SQLite file
+        model.cache = PredictionCache(
+            max_size=app.config['PREDICTION_CACHE_SIZE'],
+            path=app.config['PREDICTION_CACHE_PATH'],
+            max_disk_size=app.config['PREDICTION_CACHE_DISK_SIZE'],
+            namespace=_cache_namespace(app, key, version, path, model)
+        )
+
+    model.metrics = app.extensions.get('metrics')
+
+    app.logger.info(f'model: {key} version {version} loaded from {path}')
+
+    return model
+
+
+def _cache_namespace(app, key, version, path, model):
+    # file of version can be overwritten by retrained model, and raw message is preprocessed differently
+    # by other pipeline or translation config, so entries of persistent cache are kept apart by all of them
+    stat = os.stat(path)
+    config = json.dumps([
+        stat.st_mtime_ns,
+        stat.st_size,
+        model.preprocessor.processing_pipe,
+        app.config['TRANSLATION_BACKEND'],
+        app.config['TRANSLATION_MAX_ASCII_LENGTH'],
+    ])
+
+    return f'{key}/{version}:{hashlib.sha1(config.encode("utf-8")).hexdigest()[:16]}:'
+
+
+def _unknown_version(version):
+    # None means the latest version
+    return version is not None and version not in _registry().versions(current_app.config['MODEL_KEY'])
+
+
+def _predicted_class(prediction):
+    # name of the most probable category, None if prediction failed
+    if not isinstance(prediction, list):
+        return None
+
+    labels = sorted(MessageCategorizer.label_mapper, key=MessageCategorizer.label_mapper.get)
+
+    return labels[prediction.index(max(prediction))].replace('__label__', '')
+
+
+def _predictor(version=None):
+    global batcher_mc
+
+    # requests to exact version are not batched with requests to the latest one
+    if not current_app.config['MICRO_BATCHING'] or version is not None:
+        return _model(version)
+
+    model = _model()
+
+    if batcher_mc is None:
+        with singletons_lock:
+            if batcher_mc is None:
+                batcher_mc = MicroBatcher(
+                    model,
+                    max_batch_size=current_app.config['MICRO_BATCH_MAX_SIZE'],
+                    max_wait_ms=current_app.config['MICRO_BATCH_MAX_WAIT_MS']
+                )
+
+    # the latest version is reloaded in background
+    batcher_mc.model = model
+
+    return batcher_mc
+
+
+def _categorize_items(items, version=None):
+    model = _model(version)
+
+    results = []
+    valid = []
+
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get('user_message'), str):
+            result = {'id': item.get('id'), 'message': 'ok', 'prediction': -1}
+            valid.append((result, item['user_message']))
+        else:
+            result = {'id': item.get('id') if isinstance(item, dict) else None,
+                      'message': 'expected user_message field', 'prediction': -1}
+
+        results.append(result)
+
+    try:
+        predictions = model.predict_proba_batch([message for _, message in valid]).tolist()
+    except Exception as e:
+        current_app.logger.warning(f'exception: {e}')
+
+        # find broken messages one by one to not fail the whole batch
+        predictions = []
+        for result, message in valid:
+            try:
+                predictions.append(model.predict_proba(message))
+            except Exception as e:
+                current_app.logger.warning(f'exception: {e}')
+                result['message'] = 'bad'
+                predictions.append(-1)
+
+    for (result, _), prediction in zip(valid, predictions):
+        result['prediction'] = prediction
+
+    return results
@@ -0,0 +1,181 @@
+"""This is where we create the async (ASGI) application, it serves the same
+categorize_message contract as Flask app created by create_app"""
+
+import asyncio
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from project.api import support_department
+from project.ml import text_preprocessing
+
+
+class AsgiApp:
+    """ASGI application to categorize messages without blocking the server on slow steps
+
+    Model lookup and language detection run in bounded executor, then translation by backend
+    (the only I/O-bound step) is awaited in I/O executor and fills cache of translator,
+    then preprocessing and inference run in bounded executor and find translation in cache.
+    Event loop only parses requests and sends responses.
+    """
+
+    categorize_message_path = '/api/v1/support_department/categorize_message'
+
+    def __init__(self, flask_app):
+        """
+        Parameters
+        ----------
+        flask_app: Flask, required
+            app created by create_app, it provides config, logger and warmed up model
+
+        Attributes
+        ----------
+        cpu_executor : ThreadPoolExecutor
+            executor of model lookup, language detection, preprocessing and inference,
+            its size bounds number of concurrent inferences
+        io_executor : ThreadPoolExecutor
+            executor of translation by backend
+
+        """
+        self.flask_app = flask_app
+
+        self.cpu_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['ASGI_CPU_WORKERS'], thread_name_prefix='inference')
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['ASGI_IO_WORKERS'], thread_name_prefix='translation')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.__lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            return
+
+        start = time.perf_counter()
+        metrics = self.flask_app.extensions['metrics']
+
+        if scope['path'] == '/metrics':
+            await _send(send, 200, b'text/plain; version=0.0.4', metrics.render().encode('utf-8'))
+            return
+
+        if scope['path'] != self.categorize_message_path:
+            status, response = 404, {'message': 'not found'}
+        elif scope['method'] != 'POST':
+            status, response = 405, {'message': 'method not allowed'}
+        else:
+            status, response = await self.categorize_message(await _read_body(receive))
+
+        # the same body as flask jsonify
+        body = (json.dumps(response, separators=(',', ':'), sort_keys=True) + '\n').encode('utf-8')
+
+        await _send(send, status, b'application/json', body)
+
+        # the same metrics as request hooks of flask app
+        endpoint = 'api.categorize_message' if scope['path'] == self.categorize_message_path else 'unknown'
+
+        metrics.inc('http_requests_total', (
+            ('endpoint', endpoint), ('method', scope['method']), ('status', str(status))))
+        metrics.observe('http_request_duration_seconds', (
+            ('endpoint', endpoint), ('method', scope['method'])), time.perf_counter() - start)
+
+    async def categorize_message(self, body):
+        """The same as ``support_department.categorize_message``, returns status and response"""
+        start = time.perf_counter()
+        message_length = None
+
+        # default prediction is -1 if something wrong
+        response = {'message': 'ok', 'prediction': -1}
+        status = 200
+
+        try:
+            if body != b'':
+                data = json.loads(body)
+
+                if 'user_message' in data:
+                    loop = asyncio.get_running_loop()
+                    message = data['user_message']
+                    message_length = len(message)
+
+                    predictor, needs_translation = await loop.run_in_executor(
+                        self.cpu_executor, self.__prepare, message, data.get('model_version'))
+
+                    if predictor is None:
+                        status = 404
+                        response['message'] = 'unknown model version'
+                    else:
+                        if needs_translation:
+                            await loop.run_in_executor(
+                                self.io_executor, partial(text_preprocessing.translator.translate, detected=True),
+                                message)
+
+                        # get final prediction like 3-components 1d-array of floats
+                        response['prediction'] = await loop.run_in_executor(
+                            self.cpu_executor, predictor.predict_proba, message)
+                else:
+                    status = 404
+                    response['message'] = 'expected user_message field'
+            else:
+                status = 404
+                response['message'] = 'expected data in json'
+
+        except Exception as e:
+            self.flask_app.logger.warning(f'exception: {e}')
+            response['message'] = 'bad'
+            status = 500
+
+        self.flask_app.logger.info('request: categorize user message', extra={
+            'status': status,
+            'latency_ms': (time.perf_counter() - start) * 1000,
+            'message_length': message_length,
+            'predicted_class': support_department._predicted_class(response['prediction'])
+        })
+
+        return status, response
+
+    def __prepare(self, message, version):
+        # the latest version of model can be reloaded, so it's got for every request, loading of
+        # new version takes seconds, so it runs in executor with app context of executor thread
+        with self.flask_app.app_context():
+            if support_department._unknown_version(version):
+                return None, False
+
+            model, predictor = support_department._model(version), support_department._predictor(version)
+
+        return predictor, 'translate' in model.preprocessor.processing_pipe and \
+            text_preprocessing.translator.needs_translation(message)
+
+    async def __lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.cpu_executor.shutdown(wait=False)
+                self.io_executor.shutdown(wait=False)
+
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+async def _read_body(receive):
+    body = b''
+
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+
+        if not message.get('more_body', False):
+            return body
+
+
+async def _send(send, status, content_type, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
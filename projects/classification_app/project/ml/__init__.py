@@ -1,3 +1,9 @@
 """This module contains all ML classes to solve different problems"""
 
 from . import message_categorization
+from . import micro_batching
+from . import prediction_cache
+from . import profiling
+from . import spelling
+from . import startup
+from . import translation
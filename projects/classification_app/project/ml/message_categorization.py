@@ -1,10 +1,26 @@
+import os
+import pickle
+import re
+import time
+
+from collections import Counter
+
 import fasttext
+import numpy as np
+
+from scipy.sparse import csr_matrix
 
 from .text_preprocessing import TextPreprocessor
+from .startup import timed
 
+# model path doesn't depend on working directory of the app
+default_model_path = os.path.join(os.path.dirname(__file__), 'storage', 'message_categorizer', 'fasttext.ftz')
 
-class MessageCategorizer:
-    """Class to classify category of input-message, where categories = {afs, other, ps}"""
+
+class FastTextBackend:
+    """fastText compressed custom-trained classificator from original fasttext lib"""
+
+    name = 'fasttext'
 
     """map fasttext labels to their position at response proba-array"""
     label_mapper = {
@@ -13,27 +29,241 @@ class MessageCategorizer:
         '__label__ps': 2,
     }
 
-    def __init__(self, preprocessing_pipe=None):
+    # model is trained on messages preprocessed by default pipeline of TextPreprocessor
+    preprocessing_pipe = None
+
+    def __init__(self, model_path):
+        # load model (just 2mb)
+        with timed('fasttext_model'):
+            self.model = fasttext.load_model(model_path)
+
+    def predict_proba(self, x):
+        """Get probabilities [afs, other, ps] of preprocessed message as list"""
+        pred = self.model.predict(x, k=3)
+
+        # fasttext predict has specific format: it ranged by prediction proba
+        # code below transform fasttext to format [afs, other, ps] by label_mapper
+        formatted_pred = [0, 0, 0]
+        for i, label in enumerate(pred[0]):
+            # idx – correct position in array
+            # i – current position in array
+            # label – string in format __label__{afs|other|ps}
+
+            idx = self.label_mapper[label]
+            formatted_pred[idx] = pred[1][i]
+
+        return formatted_pred
+
+    def predict_proba_batch(self, messages):
+        """Get probabilities [afs, other, ps] of preprocessed messages as N×3 array"""
+        labels, probs = self.model.predict(messages, k=3)
+
+        # map every unique label once and place probabilities to their positions [afs, other, ps]
+        unique_labels, inverse = np.unique(np.array(labels), return_inverse=True)
+        idx = np.array([self.label_mapper[label] for label in unique_labels])[inverse.reshape(-1)]
+
+        prediction = np.zeros((len(messages), len(self.label_mapper)))
+        np.put_along_axis(prediction, idx.reshape(len(messages), -1), np.array(probs, dtype=np.float64), axis=1)
+
+        return prediction
+
+
+class TfidfSvmBackend:
+    """TF-IDF vectorizer and LinearSVC of projects/text_classification without sklearn at prediction time
+
+    Vocabulary, idf and coefficients are stored as plain arrays in .npz file. Messages of batch are
+    vectorized to one sparse matrix and scored by one sparse-dense product with contiguous coefficients.
+    """
+
+    name = 'tfidf_svm'
+
+    # the model is trained on lowercase tokens lemmatized by wordnet (e.g. payments -> payment, was -> wa)
+    # without words with digits as in the notebook, __number__ and __email__ are not in vocabulary,
+    # so they are dropped by vectorizer as well as single chars and punctuation by its token pattern
+    preprocessing_pipe = [
+        'translate',
+        'to_lower',
+        'clean_email',
+        'tokenize',
+        'clean_number',
+        'lemmatize',
+        'remove_spaces'
+    ]
+
+    def __init__(self, model_path):
+        """
+        Parameters
+        ----------
+        model_path: str, required
+            path to .npz file saved by ``convert``
+
+        Attributes
+        ----------
+        vocabulary : dict of str: int
+            column of every token
+        idf : numpy.ndarray
+            inverse document frequency of every column
+        coef : numpy.ndarray
+            C-contiguous coefficients with shape V×3 where V – size of vocabulary, columns are [afs, other, ps]
+        intercept : numpy.ndarray
+            intercepts of classes [afs, other, ps]
+
+        """
+        with timed('tfidf_svm_model'):
+            arrays = np.load(model_path, allow_pickle=False)
+
+            self.vocabulary = {token: i for i, token in enumerate(arrays['vocabulary'].tolist())}
+            self.idf = np.ascontiguousarray(arrays['idf'], dtype=np.float64)
+            self.coef = np.ascontiguousarray(arrays['coef'].T, dtype=np.float64)
+            self.intercept = np.ascontiguousarray(arrays['intercept'], dtype=np.float64)
+
+            self.token_pattern = re.compile(str(arrays['token_pattern']))
+            self.lowercase = bool(arrays['lowercase'])
+
+    def predict_proba(self, x):
+        """Get pseudo-probabilities [afs, other, ps] of preprocessed message as list"""
+        return self.predict_proba_batch([x])[0].tolist()
+
+    def predict_proba_batch(self, messages):
+        """Get pseudo-probabilities [afs, other, ps] of preprocessed messages as N×3 array
+
+        Notes
+        ----------
+
+        LinearSVC has no probabilities, so they are softmax of decision function:
+        the most probable category is the same as predicted by LinearSVC.
+        """
+        scores = self.decision_function(messages)
+
+        exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def decision_function(self, messages):
+        """Get decision function of LinearSVC for preprocessed messages as N×3 array"""
+        indptr = [0]
+        indices = []
+        counts = []
+
+        for x in messages:
+            tokens = self.token_pattern.findall(x.lower() if self.lowercase else x)
+            columns = Counter(self.vocabulary[t] for t in tokens if t in self.vocabulary)
+
+            indices.extend(columns.keys())
+            counts.extend(columns.values())
+            indptr.append(len(indices))
+
+        indices = np.array(indices, dtype=np.int32)
+        values = np.array(counts, dtype=np.float64) * self.idf[indices]
+
+        # rows are l2-normalized after the product, so the matrix is built once
+        rows = np.repeat(np.arange(len(messages)), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(messages)))
+        norms[norms == 0] = 1
+
+        if len(messages) == 1:
+            # building sparse matrix costs more than scoring of one message by its rows of coefficients
+            return (values @ self.coef[indices])[None, :] / norms[:, None] + self.intercept
+
+        tfidf = csr_matrix((values, indices, np.array(indptr, dtype=np.int32)), shape=(len(messages), len(self.idf)))
+
+        return (tfidf @ self.coef) / norms[:, None] + self.intercept
+
+    @staticmethod
+    def convert(path, vectorizer_path, model_path):
+        """Convert pickled TfidfVectorizer and LinearSVC of notebook to .npz file, it needs sklearn
+
+        Notes
+        ----------
+
+        Example input:
+
+            $ path = 'project/ml/storage/message_categorizer_tfidf_svm/multiclf.npz'
+            $ vectorizer_path = '../text_classification/models/multiclf_tfidf.pickle'
+            $ model_path = '../text_classification/models/multiclf_model.pickle'
+
+        """
+        with open(vectorizer_path, 'rb') as f:
+            vectorizer = pickle.load(f)
+
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+
+        # attributes are read from pickles of old sklearn versions too
+        tfidf = vectorizer.__dict__['_tfidf'].__dict__
+
+        if vectorizer.analyzer != 'word' or vectorizer.ngram_range != (1, 1) or vectorizer.preprocessor is not None \
+                or vectorizer.tokenizer is not None or tfidf['norm'] != 'l2' or tfidf['sublinear_tf'] or not tfidf['use_idf']:
+            raise ValueError('only word unigram vectorizer with l2 norm and idf is supported')
+
+        if list(model.classes_) != [0, 1, 2]:
+            raise ValueError('expected classes 0 - afs, 1 - other, 2 - ps')
+
+        vocabulary = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        idf = tfidf['idf_'] if 'idf_' in tfidf else tfidf['_idf_diag'].diagonal()
+
+        np.savez_compressed(
+            path,
+            vocabulary=np.array(vocabulary),
+            idf=np.asarray(idf, dtype=np.float64),
+            coef=np.asarray(model.coef_, dtype=np.float64),
+            intercept=np.asarray(model.intercept_, dtype=np.float64),
+            token_pattern=np.array(vectorizer.token_pattern),
+            lowercase=np.array(vectorizer.lowercase)
+        )
+
+
+"""map model file extensions to backends loading them"""
+categorization_backends = {
+    '.ftz': FastTextBackend,
+    '.bin': FastTextBackend,
+    '.npz': TfidfSvmBackend,
+}
+
+
+class MessageCategorizer:
+    """Class to classify category of input-message, where categories = {afs, other, ps}"""
+
+    """map fasttext labels to their position at response proba-array"""
+    label_mapper = FastTextBackend.label_mapper
+
+    def __init__(self, preprocessing_pipe=None, cache=None, model_path=None, metrics=None):
         """
         Parameters
         ----------
         preprocessing_pipe: list of str, optional, default=None
-            preprocessing_pipe=None means default pipeline will be used
+            preprocessing_pipe=None means pipeline of backend will be used
             Default pipe list can be found in text_preprocessing module
+        cache: PredictionCache, optional, default=None
+            cache of predictions by raw and by preprocessed message, None means no caching
+        model_path: str, optional, default=None
+            path to model, model_path=None means fasttext model stored in the package,
+            backend is chosen by file extension, see categorization_backends
+        metrics: Metrics, optional, default=None
+            metrics to record latency of every prediction, None means no metrics
 
         Attributes
         ----------
-        model : fasttext
-            fasttext compressed custom-trained classificator from original fasttext lib
+        model : FastTextBackend or TfidfSvmBackend
+            backend to predict probabilities of preprocessed messages
         preprocessor : TextPreprocessor
             instance of TextPreprocessor to preprocess input messages with pipeline config
+        cache : PredictionCache
+            cache of predictions, can be set after creation
+        metrics : Metrics
+            metrics of predictions, can be set after creation
 
         """
-        # load model (just 2mb)
-        self.model = fasttext.load_model('project/ml/storage/message_categorizer/fasttext.ftz')
+        model_path = default_model_path if model_path is None else model_path
+        backend = categorization_backends[os.path.splitext(model_path)[1]]
+
+        self.model = backend(model_path)
 
         # create text preprocessor with pipeline config
-        self.preprocessor = TextPreprocessor(preprocessing_pipe)
+        self.preprocessor = TextPreprocessor(backend.preprocessing_pipe if preprocessing_pipe is None else preprocessing_pipe)
+
+        self.cache = cache
+        self.metrics = metrics
 
     def predict_proba(self, x):
         """Method for calculation workload scoring based on historical data
@@ -62,23 +292,50 @@ class MessageCategorizer:
 
         """
 
-        try:
-            x = self.preprocessor.preprocess(x)
-        except Exception as e:
-            print(e)
+        if self.metrics is None:
+            return self.__predict_proba(x)
 
-        pred = self.model.predict(x, k=3)
+        start = time.perf_counter()
+        prediction = self.__predict_proba(x)
+        self.metrics.observe_inference('predict_proba', time.perf_counter() - start, 1)
 
-        # fasttext predict has specific format: it ranged by prediction proba
-        # code below transform fasttext to format [afs, other, ps] by label_mapper
-        formatted_pred = [0, 0, 0]
-        for i, label in enumerate(pred[0]):
-            # idx – correct position in array
-            # i – current position in array
-            # label – string in format __label__{afs|other|ps}
+        return prediction
 
-            idx = self.label_mapper[label]
-            formatted_pred[idx] = pred[1][i]
+    def __predict_proba(self, x):
+        if self.cache is None:
+            return self.__predict(self.__preprocess(x))
+
+        # raw message is looked up first to skip preprocessing,
+        # then preprocessed one to reuse prediction of messages different only in noise
+        prediction = self.cache.get('raw', x)
+        if prediction is not None:
+            return prediction
+
+        preprocessed = self.__preprocess(x)
+
+        prediction = self.cache.get('preprocessed', preprocessed)
+        if prediction is None:
+            prediction = self.__predict(preprocessed)
+            self.cache.put('preprocessed', preprocessed, prediction)
+
+        self.cache.put('raw', x, prediction)
+
+        return prediction
+
+    def profile(self):
+        """Method to get time, calls and input/output lengths histograms of sampled preprocessing steps
+        and fasttext predictions (steps predict and predict_batch), see ``TextPreprocessor.profile``"""
+        return self.preprocessor.profile()
+
+    def __predict(self, x):
+        profiler = self.preprocessor.profiler
+
+        if profiler is not None and profiler.sample():
+            start = time.perf_counter()
+            formatted_pred = self.model.predict_proba(x)
+            profiler.record('predict', time.perf_counter() - start, len(x), 1)
+        else:
+            formatted_pred = self.model.predict_proba(x)
 
         # little hack
         max_prob = max(formatted_pred)
@@ -89,3 +346,109 @@ class MessageCategorizer:
                 formatted_pred[i] = 1.0 if i == max_id else 0.0
 
         return formatted_pred
+
+    def predict_proba_batch(self, messages):
+        """Method to predict category probabilities of many messages by one fasttext call
+
+        Parameters
+        ----------
+        messages: list of str, required
+            raw messages (before preprocessing) to predict category
+
+        Returns
+        -------
+        prediction
+            2d-array of floats with shape N×3 where N – number of messages,
+            the same as ``predict_proba`` for every message row by row
+
+        Notes
+        ----------
+
+        Example input:
+
+            $ messages = ['hello xsolla, i have problems with epic store payments', 'where is my refund?']
+
+        Example output:
+
+            $ prediction = array([[0.14, 0.01, 0.85],
+                                  [1.  , 0.  , 0.  ]])
+
+        """
+
+        if self.metrics is None:
+            return self.__predict_proba_batch(messages)
+
+        start = time.perf_counter()
+        prediction = self.__predict_proba_batch(messages)
+        self.metrics.observe_inference('predict_proba_batch', time.perf_counter() - start, len(messages))
+
+        return prediction
+
+    def __predict_proba_batch(self, messages):
+        if self.cache is None:
+            return self.__predict_batch([self.__preprocess(x) for x in messages])
+
+        prediction = np.zeros((len(messages), len(self.label_mapper)))
+
+        # look up raw messages, then preprocessed ones, and predict the rest by one fasttext call
+        missing = []
+        for i, x in enumerate(messages):
+            cached = self.cache.get('raw', x)
+
+            if cached is None:
+                missing.append(i)
+            else:
+                prediction[i] = cached
+
+        preprocessed = {i: self.__preprocess(messages[i]) for i in missing}
+
+        not_cached = []
+        for i in missing:
+            cached = self.cache.get('preprocessed', preprocessed[i])
+
+            if cached is None:
+                not_cached.append(i)
+            else:
+                prediction[i] = cached
+
+        prediction[not_cached] = self.__predict_batch([preprocessed[i] for i in not_cached])
+
+        for i in not_cached:
+            self.cache.put('preprocessed', preprocessed[i], prediction[i].tolist())
+
+        for i in missing:
+            self.cache.put('raw', messages[i], prediction[i].tolist())
+
+        return prediction
+
+    def __predict_batch(self, messages):
+        if len(messages) == 0:
+            return np.zeros((len(messages), len(self.label_mapper)))
+
+        profiler = self.preprocessor.profiler
+
+        if profiler is not None and profiler.sample():
+            start = time.perf_counter()
+            prediction = self.model.predict_proba_batch(messages)
+            profiler.record('predict_batch', time.perf_counter() - start, len(messages), len(messages))
+        else:
+            prediction = self.model.predict_proba_batch(messages)
+
+        # little hack as in predict_proba
+        max_prob = prediction.max(axis=1)
+        confident = max_prob > 0.5
+
+        one_hot = np.zeros_like(prediction)
+        one_hot[np.arange(len(messages)), prediction.argmax(axis=1)] = 1.0
+
+        prediction[confident] = one_hot[confident]
+
+        return prediction
+
+    def __preprocess(self, x):
+        try:
+            x = self.preprocessor.preprocess(x)
+        except Exception as e:
+            print(e)
+
+        return x
@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Class to collect concurrent predictions to one batch of MessageCategorizer
+
+    Requests arrived within max_wait_ms after the first one (at most max_batch_size)
+    are preprocessed and predicted together by ``predict_proba_batch`` in background thread.
+    """
+
+    def __init__(self, model, max_batch_size=32, max_wait_ms=5):
+        """
+        Parameters
+        ----------
+        model: MessageCategorizer, required
+            model with predict_proba and predict_proba_batch methods, can be replaced after creation
+        max_batch_size: int, optional, default=32
+            max number of messages in one batch
+        max_wait_ms: float, optional, default=5
+            max time to wait for other messages after the first message of batch
+
+        Attributes
+        ----------
+        batch_sizes : dict of int: int
+            histogram of achieved batch sizes: number of batches by their size
+
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.batch_sizes = {}
+
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def predict_proba(self, x):
+        """Method to predict category probability of input-message in batch with concurrent requests
+
+        The same as ``MessageCategorizer.predict_proba``, blocks until the batch with message is predicted.
+        """
+        return self.submit(x).result()
+
+    def submit(self, x):
+        """Put message to queue and get future of its prediction"""
+        self.__start()
+
+        future = Future()
+        self.queue.put((x, future))
+
+        return future
+
+    def metrics(self):
+        """Get number of batches and messages, mean batch size and histogram of batch sizes"""
+        with self.lock:
+            batch_sizes = dict(self.batch_sizes)
+
+        num_of_batches = sum(batch_sizes.values())
+        num_of_messages = sum(size * count for size, count in batch_sizes.items())
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'num_of_batches': num_of_batches,
+            'num_of_messages': num_of_messages,
+            'mean_batch_size': num_of_messages / num_of_batches if num_of_batches > 0 else 0,
+            'batch_sizes': batch_sizes
+        }
+
+    def __start(self):
+        # thread is started lazily in the process which serves requests, e.g. in gunicorn worker after fork
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.__run, name='micro-batcher', daemon=True)
+                self.thread.start()
+
+    def __run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self.__predict(batch)
+
+    def __predict(self, batch):
+        with self.lock:
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+        # model can be replaced by its new version, the whole batch is predicted by one of them
+        model = self.model
+
+        try:
+            predictions = model.predict_proba_batch([x for x, _ in batch]).tolist()
+        except Exception:
+            # predict one by one to fail only broken messages
+            for x, future in batch:
+                try:
+                    future.set_result(model.predict_proba(x))
+                except Exception as e:
+                    future.set_exception(e)
+
+            return
+
+        for (_, future), prediction in zip(batch, predictions):
+            future.set_result(prediction)
@@ -0,0 +1,254 @@
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+# records propagate to logger of app ('project'), e.g. to its queue handler
+logger = logging.getLogger(__name__)
+
+# models are stored as storage/{key}/{version}.{ext} e.g. storage/message_categorizer/fasttext.ftz
+default_storage_path = os.path.join(os.path.dirname(__file__), 'storage')
+
+
+class ModelRegistry:
+    """Class to load models by key and version from storage directory and reload the latest version in background
+
+    The latest version of key is the most recently modified file of its directory. New version is loaded
+    by background thread and replaces the previous one by one assignment, so requests which already
+    got the previous model finish with it, and it's freed after the last of them.
+    """
+
+    def __init__(self, loader, path=None, reload_interval=60, max_versions=2, prepare=None):
+        """
+        Parameters
+        ----------
+        loader: callable, required
+            function of key, version and file path to load model
+        path: str, optional, default=None
+            storage directory, None means storage of the package
+        reload_interval: float, optional, default=60
+            seconds between checks of new versions, 0 turns reloading off
+        max_versions: int, optional, default=2
+            max number of loaded versions of every key including the latest one,
+            the least recently used versions are unloaded
+        prepare: callable, optional, default=None
+            function of key, version, file path and loaded model to run before requests get it, e.g. warm-up,
+            it isn't counted in memory and load time of model, so they're cost of the model only
+
+        Attributes
+        ----------
+        latest : dict of str: str
+            loaded latest version of every key
+        models : dict of str: OrderedDict
+            loaded models of every key by version in order of usage
+        loads : dict of tuple: dict
+            file size, memory and time of loading and preparing of every loaded model by key and version
+
+        """
+        self.loader = loader
+        self.prepare = prepare
+        self.path = default_storage_path if path is None else path
+        self.reload_interval = reload_interval
+        self.max_versions = max_versions
+
+        self.latest = {}
+        self.models = {}
+        self.loads = {}
+
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+
+        self.thread = None
+        self.thread_pid = None
+
+    def get(self, key, version=None, start=True):
+        """Get model, load it if it isn't loaded
+
+        Parameters
+        ----------
+        key: str, required
+            name of model directory in storage
+        version: str, optional, default=None
+            name of model file without extension, None means the latest version
+        start: bool, optional, default=True
+            start reloading thread in current process, False is for warm-up in gunicorn master
+            before fork, so only workers which serve requests reload models
+
+        Raises
+        ------
+        KeyError
+            if there is no such key or version in storage
+
+        """
+        if start:
+            self.__start()
+
+        with self.lock:
+            version = self.latest.get(key) if version is None else version
+            model = self.models.get(key, {}).get(version)
+
+            if model is not None:
+                self.models[key].move_to_end(version)
+                return model
+
+        if version is None:
+            return self.__load_latest(key)
+
+        return self.__load(key, version, latest=False)
+
+    def versions(self, key):
+        """Get versions of key in storage from the oldest to the latest one"""
+        directory = os.path.join(self.path, key)
+
+        if not os.path.isdir(directory):
+            return []
+
+        files = [
+            (os.path.getmtime(os.path.join(directory, name)), os.path.splitext(name)[0])
+            for name in os.listdir(directory)
+            # files being copied are expected to have .tmp extension until they are renamed
+            if not name.startswith('.') and not name.endswith('.tmp')
+            and os.path.isfile(os.path.join(directory, name))
+        ]
+
+        return [version for _, version in sorted(files)]
+
+    def reload(self):
+        """Load new latest versions of loaded keys, returns dict of key to new version"""
+        reloaded = {}
+
+        for key in list(self.latest):
+            versions = self.versions(key)
+
+            if len(versions) > 0 and versions[-1] != self.latest[key]:
+                self.__load_latest(key)
+                reloaded[key] = versions[-1]
+
+        return reloaded
+
+    def stats(self):
+        """Get loaded versions of every key with their file size, memory and time of loading
+
+        Notes
+        ----------
+
+        Memory is growth of resident memory of the process while loading model, None if it's unknown.
+        Memory and load time don't include ``prepare``, e.g. process-wide resources loaded by warm-up
+        of the first model, its time is ``prepare_seconds``.
+
+        Example output:
+
+            $ stats = {'message_categorizer': {'latest': 'fasttext', 'versions': ['fasttext'],
+                                               'loaded': {'fasttext': {'file_size': 2010395, 'memory': 7311360,
+                                                                       'load_seconds': 0.02, 'prepare_seconds': 0.41,
+                                                                       'loaded_at': 1760000000.0}}}}
+
+        """
+        with self.lock:
+            return {
+                key: {
+                    'latest': self.latest.get(key),
+                    'versions': self.versions(key),
+                    'loaded': {version: dict(self.loads[(key, version)]) for version in models},
+                }
+                for key, models in self.models.items()
+            }
+
+    def __load_latest(self, key):
+        versions = self.versions(key)
+
+        if len(versions) == 0:
+            raise KeyError(f'no versions of model {key}')
+
+        return self.__load(key, versions[-1], latest=True)
+
+    def __load(self, key, version, latest):
+        directory = os.path.join(self.path, key)
+        names = [name for name in os.listdir(directory) if os.path.splitext(name)[0] == version] \
+            if os.path.isdir(directory) else []
+
+        if len(names) == 0:
+            raise KeyError(f'no version {version} of model {key}')
+
+        file_path = os.path.join(directory, names[0])
+
+        # one model is loaded at a time, so memory growth of process belongs to it
+        with self.load_lock:
+            with self.lock:
+                model = self.models.get(key, {}).get(version)
+
+            if model is None:
+                memory, start = _resident_memory(), time.perf_counter()
+                model = self.loader(key, version, file_path)
+
+                load = {
+                    'file_size': os.path.getsize(file_path),
+                    'memory': None if memory is None else _resident_memory() - memory,
+                    'load_seconds': time.perf_counter() - start,
+                }
+
+                start = time.perf_counter()
+
+                if self.prepare is not None:
+                    self.prepare(key, version, file_path, model)
+
+                load['prepare_seconds'] = time.perf_counter() - start
+                load['loaded_at'] = time.time()
+            else:
+                load = None
+
+        with self.lock:
+            models = self.models.setdefault(key, OrderedDict())
+
+            if load is not None:
+                models[version] = model
+                self.loads[(key, version)] = load
+
+            models.move_to_end(version)
+
+            if latest:
+                self.latest[key] = version
+
+            # unloaded model is freed when requests which use it are finished
+            for old_version in list(models):
+                if len(models) <= self.max_versions:
+                    break
+
+                if old_version != self.latest.get(key):
+                    del models[old_version]
+                    del self.loads[(key, old_version)]
+
+        return model
+
+    def __start(self):
+        # reloading thread is started lazily by the first request of process, e.g. in gunicorn worker after fork,
+        # forked process doesn't inherit thread of parent but inherits its locks in any state
+        if self.reload_interval <= 0 or self.thread_pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.thread_pid != os.getpid():
+                self.thread = threading.Thread(target=self.__run, name='model-reloader', daemon=True)
+                self.thread.start()
+                self.thread_pid = os.getpid()
+
+    def __run(self):
+        while True:
+            time.sleep(self.reload_interval)
+
+            try:
+                self.reload()
+            except Exception:
+                # broken file of new version keeps the previous version serving
+                logger.exception('model: reloading failed')
+
+
+def _resident_memory():
+    # resident memory of the process in bytes, available on Linux only
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+
+"""max number of buffered access times of disk hits, they are written by one statement"""
+max_disk_accessed = 1000
+
+
+class PredictionCache:
+    """Class to cache predictions of MessageCategorizer by raw and by preprocessed message text
+
+    In-process LRU cache with optional SQLite file shared by all workers of the server.
+    """
+
+    def __init__(self, max_size=10000, path=None, max_disk_size=100000, namespace=''):
+        """
+        Parameters
+        ----------
+        max_size: int, optional, default=10000
+            max number of entries in process memory, the least recently used entries are evicted
+        path: str, optional, default=None
+            path to SQLite file shared by workers, None means memory cache only
+        max_disk_size: int, optional, default=100000
+            max number of entries in SQLite file
+        namespace: str, optional, default=''
+            prefix of keys, caches with different namespaces share SQLite file without sharing entries
+            e.g. caches of different model versions
+
+        Attributes
+        ----------
+        hits : dict of str: int
+            number of hits by level: memory, disk
+        misses : int
+            number of lookups found nowhere
+
+        """
+        self.max_size = max_size
+        self.path = path
+        self.max_disk_size = max_disk_size
+        self.namespace = namespace
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        self.evictions = 0
+
+        self.connection = None
+        self.connection_pid = None
+        self.num_of_disk_puts = 0
+
+        # access times of disk hits, written with the next put not to make every read a write
+        self.disk_accessed = {}
+
+    def get(self, kind, text):
+        """Get cached prediction or None
+
+        Parameters
+        ----------
+        kind: str, required
+            'raw' for message before preprocessing, 'preprocessed' for message after preprocessing
+        text: str, required
+            message text
+
+        """
+        key = _key(self.namespace + kind, text)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits['memory'] += 1
+
+                return list(self.entries[key])
+
+        prediction = self.__disk_get(key)
+
+        with self.lock:
+            if prediction is None:
+                self.misses += 1
+                return None
+
+            self.hits['disk'] += 1
+            self.__memory_put(key, prediction)
+
+        return list(prediction)
+
+    def put(self, kind, text, prediction):
+        """Store prediction, parameters are the same as in ``get``"""
+        key = _key(self.namespace + kind, text)
+        prediction = tuple(prediction)
+
+        with self.lock:
+            self.__memory_put(key, prediction)
+
+        self.__disk_put(key, prediction)
+
+    def stats(self):
+        """Get hit and miss counters and sizes of cache"""
+        with self.lock:
+            lookups = sum(self.hits.values()) + self.misses
+
+            return {
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'hit_rate': sum(self.hits.values()) / lookups if lookups > 0 else 0,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'max_size': self.max_size
+            }
+
+    def __memory_put(self, key, prediction):
+        self.entries[key] = prediction
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __disk_get(self, key):
+        if self.path is None:
+            return None
+
+        with self.lock:
+            connection = self.__connection()
+            row = connection.execute('select value from predictions where key = ?', (key,)).fetchone()
+
+            if row is not None:
+                self.disk_accessed[key] = time.time()
+
+                # read-only workload flushes access times by large batches
+                if len(self.disk_accessed) >= max_disk_accessed:
+                    self.__flush_disk_accessed(connection)
+                    connection.commit()
+
+        return None if row is None else tuple(json.loads(row[0]))
+
+    def __disk_put(self, key, prediction):
+        if self.path is None:
+            return
+
+        with self.lock:
+            connection = self.__connection()
+            connection.execute(
+                'insert or replace into predictions values (?, ?, ?)', (key, json.dumps(prediction), time.time()))
+
+            # access times are written before trimming, so recently read entries are not evicted
+            self.__flush_disk_accessed(connection)
+
+            # trim file from time to time not to count entries on every put
+            self.num_of_disk_puts += 1
+            if self.num_of_disk_puts % 100 == 0:
+                connection.execute(
+                    'delete from predictions where key in ('
+                    'select key from predictions order by accessed desc limit -1 offset ?)', (self.max_disk_size,))
+
+            connection.commit()
+
+    def __flush_disk_accessed(self, connection):
+        if len(self.disk_accessed) > 0:
+            connection.executemany(
+                'update predictions set accessed = ? where key = ? and accessed < ?',
+                [(accessed, key, accessed) for key, accessed in self.disk_accessed.items()])
+
+            self.disk_accessed = {}
+
+    def __connection(self):
+        # every worker process opens its own connection to the shared file, e.g. after gunicorn fork
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self.connection.execute('pragma journal_mode=wal')
+            self.connection.execute(
+                'create table if not exists predictions (key text primary key, value text, accessed real)')
+            self.connection.execute('create index if not exists predictions_accessed on predictions (accessed)')
+            self.connection.commit()
+
+            self.connection_pid = os.getpid()
+
+        return self.connection
+
+
+def _key(kind, text):
+    return hashlib.sha1(f'{kind}:{text}'.encode('utf-8')).hexdigest()
@@ -0,0 +1,105 @@
+import bisect
+import random
+import threading
+
+"""upper bounds of histogram buckets, the last bucket is unbounded"""
+time_buckets_ms = [0.01, 0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000]
+length_buckets = [0, 10, 50, 100, 200, 500, 1000, 5000]
+
+
+class StepProfiler:
+    """Class to collect wall time, calls and input/output lengths of pipeline steps for sampled calls
+
+    Every step has histograms of time and lengths with fixed buckets, so collection costs
+    a few counter increments per sampled step and memory doesn't grow with number of calls.
+    """
+
+    def __init__(self, sample_rate=0.01):
+        """
+        Parameters
+        ----------
+        sample_rate: float, optional, default=0.01
+            share of calls to profile, 0 turns profiling off, 1 profiles every call
+
+        Attributes
+        ----------
+        steps : dict of str: dict
+            counters and histograms of every step by its name
+
+        """
+        self.sample_rate = sample_rate
+
+        self.steps = {}
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """Decide whether to profile current call"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record(self, step, seconds, input_length, output_length):
+        """Record one call of step
+
+        Parameters
+        ----------
+        step: str, required
+            name of step
+        seconds: float, required
+            wall time of call
+        input_length: int, required
+            length of step input e.g. number of chars or messages
+        output_length: int, required
+            length of step output
+
+        """
+        with self.lock:
+            if step not in self.steps:
+                self.steps[step] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'time_ms': [0] * (len(time_buckets_ms) + 1),
+                    'input_length': [0] * (len(length_buckets) + 1),
+                    'output_length': [0] * (len(length_buckets) + 1),
+                }
+
+            stats = self.steps[step]
+            stats['count'] += 1
+            stats['total_ms'] += seconds * 1000
+            stats['time_ms'][bisect.bisect_left(time_buckets_ms, seconds * 1000)] += 1
+            stats['input_length'][bisect.bisect_left(length_buckets, input_length)] += 1
+            stats['output_length'][bisect.bisect_left(length_buckets, output_length)] += 1
+
+    def stats(self):
+        """Get counters and histograms of every step
+
+        Notes
+        ----------
+
+        Histogram is dict of bucket upper bound (inclusive) to number of calls, '+inf' is the last bucket.
+
+        Example output:
+
+            $ stats = {'tokenize': {'count': 12, 'total_ms': 3.1, 'mean_ms': 0.26,
+                                    'time_ms': {'0.01': 0, ..., '0.5': 11, '1': 1, ..., '+inf': 0},
+                                    'input_length': {...}, 'output_length': {...}}}
+
+        """
+        with self.lock:
+            return {
+                step: {
+                    'count': stats['count'],
+                    'total_ms': stats['total_ms'],
+                    'mean_ms': stats['total_ms'] / stats['count'],
+                    'time_ms': _histogram(time_buckets_ms, stats['time_ms']),
+                    'input_length': _histogram(length_buckets, stats['input_length']),
+                    'output_length': _histogram(length_buckets, stats['output_length']),
+                }
+                for step, stats in self.steps.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.steps = {}
+
+
+def _histogram(buckets, counts):
+    return {**{str(bound): count for bound, count in zip(buckets, counts)}, '+inf': counts[-1]}
@@ -0,0 +1,159 @@
+import string
+
+from functools import lru_cache
+
+from textblob.en import spelling as textblob_spelling
+
+ALPHA = 'abcdefghijklmnopqrstuvwxyz'
+
+# the same as in textblob, such tokens are never corrected
+PUNCTUATION = '.,;:!?()[]{}`\'\'"@#$^&*+-|=~_'
+
+"""placeholders of preprocessing steps, they are never corrected"""
+default_skip_tokens = {'__number__', '__email__'}
+
+
+class SpellingCorrector:
+    """Class to correct spelling of tokens like ``textblob.Word.spellcheck`` by precomputed index
+
+    Suggestions are the same as textblob ones: known word, else known words at edit distance 1,
+    else known words at edit distance 2, ranked by frequency in textblob vocabulary.
+    """
+
+    def __init__(self, vocabulary=None, skip_tokens=None, max_memo_size=100000):
+        """
+        Parameters
+        ----------
+        vocabulary: dict of str: int, optional, default=None
+            word frequencies, vocabulary=None means textblob english vocabulary
+        skip_tokens: set of str, optional, default=None
+            tokens returned as is, skip_tokens=None means default_skip_tokens
+        max_memo_size: int, optional, default=100000
+            max number of memoized token suggestions
+
+        Attributes
+        ----------
+        index : dict of str: list of str
+            known words by every their variant with at most one deleted char (symmetric delete index)
+
+        """
+        if vocabulary is None:
+            if len(textblob_spelling) == 0:
+                textblob_spelling.load()
+
+            vocabulary = dict(textblob_spelling)
+
+        self.vocabulary = vocabulary
+        self.skip_tokens = default_skip_tokens if skip_tokens is None else set(skip_tokens)
+
+        self.index = {}
+        for word in vocabulary:
+            for variant in _deletes(word):
+                self.index.setdefault(variant, []).append(word)
+
+        self.suggest = lru_cache(maxsize=max_memo_size)(self.__suggest)
+
+    def correct(self, token, confidence_threshold=0.7):
+        """Method to correct token if confidence of the best suggestion is greater than threshold
+
+        Parameters
+        ----------
+        token: str, required
+            token to correct
+        confidence_threshold: float, optional, default=0.7
+            min confidence (exclusive) of the best suggestion to replace token
+
+        Returns
+        -------
+        corrected_token
+
+        """
+        if token in self.skip_tokens:
+            return token
+
+        word, confidence = self.suggest(token)[0]
+
+        return word if confidence > confidence_threshold else token
+
+    def __suggest(self, w):
+        """The same as ``textblob.en.suggest``: list of (word, confidence) sorted by confidence"""
+        if len(w) == 1 or w in PUNCTUATION or w in string.whitespace or w.replace('.', '').isdigit():
+            return [(w, 1.0)]
+
+        candidates = [w] if w in self.vocabulary else []
+
+        if len(candidates) == 0:
+            edits = _edit1(w)
+            candidates = [e for e in edits if e in self.vocabulary]
+
+        if len(candidates) == 0:
+            # known words at edit distance 1 from edits of w are found by their deletes in index
+            # instead of generating edit distance 2 strings, then checked by exact distance
+            found = set()
+            for e in edits:
+                for variant in _deletes(e):
+                    found.update(self.index.get(variant, ()))
+
+            candidates = [c for c in found if _distance(w, c) <= 2] or [w]
+
+        candidates = [(self.vocabulary.get(c, 0.0), c) for c in candidates]
+        s = float(sum(p for p, _ in candidates) or 1)
+        candidates = sorted(((p / s, word) for p, word in candidates), reverse=True)
+
+        if w.istitle():
+            return [(word.title(), p) for p, word in candidates]
+
+        return [(word, p) for p, word in candidates]
+
+
+def _deletes(word):
+    """Word and its variants with one deleted char"""
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _edit1(w):
+    """Strings at edit distance 1 from w as in textblob: delete, transpose, replace or insert of a-z char"""
+    split = [(w[:i], w[i:]) for i in range(len(w) + 1)]
+
+    return set(
+        [a + b[1:] for a, b in split if b] +
+        [a + b[1] + b[0] + b[2:] for a, b in split if len(b) > 1] +
+        [a + c + b[1:] for a, b in split for c in ALPHA if b] +
+        [a + c + b for a, b in split for c in ALPHA]
+    )
+
+
+def _distance(a, b):
+    """Damerau–Levenshtein distance with adjacent transpositions (Lowrance–Wagner)"""
+    max_distance = len(a) + len(b)
+
+    d = [[max_distance] * (len(b) + 2) for _ in range(len(a) + 2)]
+    for i in range(len(a) + 1):
+        d[i + 1][1] = i
+    for j in range(len(b) + 1):
+        d[1][j + 1] = j
+
+    last_row = {}
+    for i in range(1, len(a) + 1):
+        last_col = 0
+
+        for j in range(1, len(b) + 1):
+            k = last_row.get(b[j - 1], 0)
+            l = last_col
+
+            if a[i - 1] == b[j - 1]:
+                cost = 0
+                last_col = j
+            else:
+                cost = 1
+
+            d[i + 1][j + 1] = min(
+                d[i][j] + cost,
+                d[i + 1][j] + 1,
+                d[i][j + 1] + 1,
+                d[k][l] + (i - k - 1) + 1 + (j - l - 1)
+            )
+
+        last_row[a[i - 1]] = i
+
+    return d[len(a) + 1][len(b) + 1]
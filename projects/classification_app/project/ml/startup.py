@@ -0,0 +1,84 @@
+import time
+
+from contextlib import contextmanager
+
+from langdetect.detector_factory import init_factory
+from nltk import word_tokenize
+from nltk.stem.wordnet import WordNetLemmatizer
+
+"""load time in seconds of every resource loaded at startup"""
+startup_timings = {}
+
+"""error of every resource failed to load at startup"""
+startup_errors = {}
+
+"""messages to warm up preprocessing and model"""
+warm_up_messages = [
+    'Hello Xsolla, when you send me 500$ i lost yesterday? Please let me know user@temp.com',
+    'i have problems with epic store payments',
+    'Привет, у меня проблема с оплатой',
+]
+
+
+@contextmanager
+def timed(resource):
+    """Record load time of resource to startup_timings, and error to startup_errors if it fails"""
+    start = time.perf_counter()
+
+    try:
+        yield
+    except Exception as e:
+        startup_errors[resource] = str(e)
+        raise
+    finally:
+        startup_timings[resource] = time.perf_counter() - start
+
+
+def warm_up(model, messages=None):
+    """Load lazy resources and run dummy predictions, so the first requests are as fast as others
+
+    Parameters
+    ----------
+    model: MessageCategorizer, required
+        model to warm up
+    messages: list of str, optional, default=None
+        messages of dummy predictions, None means warm_up_messages
+
+    Returns
+    -------
+    timings
+        load time in seconds of every resource, including loaded before e.g. fasttext model and spelling index
+
+    Notes
+    ----------
+
+    Resources are loaded one by one, failed resource is reported in startup_errors and doesn't stop others.
+
+    Example output:
+
+        $ timings = {'spelling_index': 2.61, 'fasttext_model': 0.02, 'nltk_punkt': 0.41,
+                     'langdetect_profiles': 0.35, 'dummy_predictions': 0.07}
+
+    """
+    messages = warm_up_messages if messages is None else messages
+
+    resources = [
+        ('nltk_punkt', lambda: word_tokenize('Warm up. Load tokenizer.')),
+        ('langdetect_profiles', init_factory),
+    ]
+
+    # wordnet corpus is loaded only by pipelines which lemmatize, e.g. of TfidfSvmBackend
+    if 'lemmatize' in model.preprocessor.processing_pipe:
+        resources.append(('nltk_wordnet', lambda: WordNetLemmatizer().lemmatize('payments')))
+
+    resources.append(
+        ('dummy_predictions', lambda: [model.predict_proba(x) for x in messages] + [model.predict_proba_batch(messages)]))
+
+    for resource, load in resources:
+        try:
+            with timed(resource):
+                load()
+        except Exception:
+            pass
+
+    return dict(startup_timings)
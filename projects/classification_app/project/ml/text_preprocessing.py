@@ -1,10 +1,20 @@
+import itertools
+import os
 import re
+import time
 
-from langdetect import detect
-from textblob import Word, TextBlob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+from textblob import Word
 from nltk import word_tokenize
+from nltk.stem.wordnet import WordNetLemmatizer
 
 from . import text_preprocessing_utils as utils
+from .translation import Translator
+from .spelling import SpellingCorrector
+from .startup import timed
 
 # list of functions in pipe
 default_preprocessing_pipe = [
@@ -21,11 +31,30 @@ default_preprocessing_pipe = [
     'remove_spaces'
 ]
 
+# translator of 'translate' step, offline by default, can be replaced e.g. by create_app config
+translator = Translator()
+
+# index of 'correct_spelling' step is built once at startup from textblob vocabulary
+with timed('spelling_index'):
+    spelling_corrector = SpellingCorrector()
+
+# regexes of clean_number and clean_email steps, compiled once
+number_patterns = [
+    (re.compile(r'(\d+)([a-zA-Z])'), r' \g<1> \g<2> '),
+    (re.compile(r'(\d+) (th|st|nd|rd) '), r' \g<1>\g<2> '),
+    (re.compile(r'(\d+),(\d+)'), r' \g<1>\g<2> '),
+    (re.compile(r'([A-Za-z]*[\d]+[\w]*|[\d]+[A-Za-z]+[\w]*)'), ' __number__ '),
+]
+email_pattern = re.compile(r'([^@|\s]+@[^@]+\.[^@|\s]+)')
+
+# lemmatizer of 'lemmatize' step, wordnet corpus is loaded by the first call
+lemmatizer = WordNetLemmatizer()
+
 
 class TextPreprocessor:
     """Class preprocess text in pipeline with config and standalone"""
 
-    def __init__(self, pipeline=None):
+    def __init__(self, pipeline=None, profiler=None):
         """
         Parameters
         ----------
@@ -46,14 +75,25 @@ class TextPreprocessor:
                 'remove_spaces'
             ]
 
+        profiler: StepProfiler, optional, default=None
+            profiler of pipeline steps, None means no profiling
 
         Attributes
         ----------
         processing_pipe : list of str
+        program : list of tuple
+            pipeline compiled to operations: ('call', step), ('map', translate table)
+            and ('tokens', memoized function of token), see ``_compile``
+        profiler : StepProfiler
+            profiler of pipeline steps, can be set after creation
 
         """
         self.processing_pipe = default_preprocessing_pipe if pipeline is None else pipeline
 
+        self.program = _compile(self.processing_pipe)
+
+        self.profiler = profiler
+
     def preprocess(self, text):
         """Method to predict category probability of input-message, where prediction = [afs, other, ps]
 
@@ -76,6 +116,22 @@ class TextPreprocessor:
 
                 $ processed_text = 'hello xsolla when you send me __number__ i lost yesterday please let me know __email__'
         """
+        # sampled calls are preprocessed step by step to time every step, the result is the same
+        if self.profiler is not None and self.profiler.sample():
+            return self.__preprocess_profiled(text)
+
+        for operation, arg in self.program:
+            if operation == 'call':
+                text = arg(text)
+            elif operation == 'map':
+                text = text.translate(arg)
+            else:
+                text = ' '.join([t for token in text.split() for t in arg(token)])
+
+        return text
+
+    def preprocess_stepwise(self, text):
+        """Method to preprocess text step by step without compilation, result is the same as ``preprocess``"""
         for step in self.processing_pipe:
             if step in preprocessing_mapper:
                 preprocess_method = preprocessing_mapper[step]
@@ -83,6 +139,115 @@ class TextPreprocessor:
 
         return text
 
+    def profile(self):
+        """Method to get time, calls and input/output lengths histograms of every step of sampled calls
+
+            Returns
+            -------
+            stats
+                dict of step name to its stats as in ``StepProfiler.stats``, empty if profiler is not set
+        """
+        return {} if self.profiler is None else self.profiler.stats()
+
+    def preprocess_many(self, texts, n_jobs=1, chunksize=1000):
+        """Method to preprocess many texts by process pool, results are yielded in order of texts
+
+            Parameters
+            ----------
+            texts: iterable of str, required
+                texts to preprocess, it's read lazily by chunks e.g. lines of file
+            n_jobs: int, optional, default=1
+                number of processes, -1 means number of cpu, 1 means preprocessing in current process
+            chunksize: int, optional, default=1000
+                number of texts sent to process at once
+
+            Returns
+            -------
+            processed_texts
+                generator of processed texts
+
+            Notes
+            ----------
+
+            Every process creates its own TextPreprocessor with the same pipeline once, so spelling index,
+            nltk tokenizer and memo of tokens are initialized per process, not per chunk.
+            At most 2 * n_jobs chunks are in flight, so texts are never loaded at once.
+
+            Example input:
+
+                $ texts = ['Hello Xsolla, when you send me 500$', 'Please let me know user@temp.com']
+
+            Example output:
+
+                $ list(processed_texts) = ['hello xsolla when you send me __number__', 'please let me know __email__']
+        """
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+
+        chunks = _chunks(texts, chunksize)
+
+        if n_jobs == 1:
+            for chunk in chunks:
+                yield from [self.preprocess(text) for text in chunk]
+
+            return
+
+        executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(self.processing_pipe,))
+        try:
+            pending = deque()
+
+            for chunk in chunks:
+                pending.append(executor.submit(_preprocess_chunk, chunk))
+
+                if len(pending) >= 2 * n_jobs:
+                    yield from pending.popleft().result()
+
+            while len(pending) > 0:
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def preprocess_file(self, input_path, output_path, n_jobs=1, chunksize=1000):
+        """Method to preprocess text file line by line and write results line by line as they are ready
+
+            Parameters
+            ----------
+            input_path: str, required
+                file with one text per line
+            output_path: str, required
+                file to write processed texts in the same order, one per line
+            n_jobs: int, optional, default=1
+                number of processes as in ``preprocess_many``
+            chunksize: int, optional, default=1000
+                number of lines sent to process at once
+
+            Returns
+            -------
+            num_of_texts
+                number of processed lines
+        """
+        num_of_texts = 0
+
+        with open(input_path, encoding='utf-8') as input_file, open(output_path, 'w', encoding='utf-8') as output_file:
+            texts = (line.rstrip('\n') for line in input_file)
+
+            for text in self.preprocess_many(texts, n_jobs=n_jobs, chunksize=chunksize):
+                output_file.write(text + '\n')
+                num_of_texts += 1
+
+        return num_of_texts
+
+    def __preprocess_profiled(self, text):
+        for step in self.processing_pipe:
+            if step in preprocessing_mapper:
+                start = time.perf_counter()
+                processed_text = preprocessing_mapper[step](text)
+
+                self.profiler.record(step, time.perf_counter() - start, _length(text), _length(processed_text))
+                text = processed_text
+
+        return text
+
     @staticmethod
     def detect_anomaly(text):
         # TODO
@@ -99,27 +264,12 @@ class TextPreprocessor:
 
     @staticmethod
     def translate(text):
-        lang = detect(text)
-
-        if lang == 'en':
-            return text
-
-        try:
-            blob = TextBlob(text)
-            translated = str(blob.translate())
-        except Exception as e:
-            print(e)
-            return text
-
-        return translated
+        return translator.translate(text)
 
     @staticmethod
     def clean_number(text):
-        text = re.sub(r'(\d+)([a-zA-Z])', r' \g<1> \g<2> ', text)
-        text = re.sub(r'(\d+) (th|st|nd|rd) ', r' \g<1>\g<2> ', text)
-        text = re.sub(r'(\d+),(\d+)', r' \g<1>\g<2> ', text)
-
-        text = re.sub(r'([A-Za-z]*[\d]+[\w]*|[\d]+[A-Za-z]+[\w]*)', ' __number__ ', text)
+        for pattern, replacement in number_patterns:
+            text = pattern.sub(replacement, text)
 
         return text
 
@@ -149,6 +299,12 @@ class TextPreprocessor:
 
     @staticmethod
     def correct_spelling(text, confidence_threshold=0.7):
+        tokens = [spelling_corrector.correct(token, confidence_threshold) for token in text.split()]
+
+        return ' '.join(tokens).strip()
+
+    @staticmethod
+    def correct_spelling_textblob(text, confidence_threshold=0.7):
         tokens = text.split()
 
         for i, token in enumerate(tokens):
@@ -159,6 +315,10 @@ class TextPreprocessor:
 
         return ' '.join(tokens).strip()
 
+    @staticmethod
+    def lemmatize(text):
+        return ' '.join([lemmatizer.lemmatize(t) for t in text.split()])
+
     @staticmethod
     def clean_contractions(text):
         mapping = utils.contraction_mapping
@@ -184,7 +344,7 @@ class TextPreprocessor:
 
     @staticmethod
     def clean_email(text):
-        return re.sub(r'([^@|\s]+@[^@]+\.[^@|\s]+)', ' __email__ ', text)
+        return email_pattern.sub(' __email__ ', text)
 
 
 # TODO write mapper generator
@@ -198,8 +358,151 @@ preprocessing_mapper = {
     'remove_stopwords': TextPreprocessor.remove_stopwords,
     'remove_spaces': TextPreprocessor.remove_spaces,
     'correct_spelling': TextPreprocessor.correct_spelling,
+    'correct_spelling_textblob': TextPreprocessor.correct_spelling_textblob,
     'clean_contractions': TextPreprocessor.clean_contractions,
     'clean_special_chars': TextPreprocessor.clean_special_chars,
     'segregate_special_chars': TextPreprocessor.segregate_special_chars,
     'clean_email': TextPreprocessor.clean_email,
+    'lemmatize': TextPreprocessor.lemmatize,
 }
+
+
+# preprocessor of process of pool in preprocess_many
+_worker_preprocessor = None
+
+
+def _init_worker(pipeline):
+    global _worker_preprocessor
+
+    _worker_preprocessor = TextPreprocessor(pipeline)
+
+    # load lazy resources like nltk tokenizer once per process
+    _worker_preprocessor.preprocess('')
+
+
+def _preprocess_chunk(texts):
+    return [_worker_preprocessor.preprocess(text) for text in texts]
+
+
+def _length(text):
+    return len(text) if isinstance(text, str) else 0
+
+
+def _chunks(texts, chunksize):
+    texts = iter(texts)
+
+    while True:
+        chunk = list(itertools.islice(texts, chunksize))
+
+        if len(chunk) == 0:
+            return
+
+        yield chunk
+
+
+"""steps applied to every token independently: function of token returns new token or None to remove it"""
+token_steps = {
+    'clean_contractions': lambda t: utils.contraction_mapping.get(t, t),
+    'remove_special_chars': lambda t: None if t in utils.special_chars else t,
+    'remove_stopwords': lambda t: None if t in utils.stopwords else t,
+    'correct_spelling': lambda t: spelling_corrector.correct(t),
+    'lemmatize': lambda t: lemmatizer.lemmatize(t),
+}
+
+"""steps replacing single chars one after another: function returns list of (char, replacement)"""
+char_mapping_steps = {
+    'clean_special_chars': lambda: list(utils.special_chars_mapping.items()),
+    'segregate_special_chars': lambda: [(p, f' {p} ') for p in utils.special_chars],
+}
+
+
+def _compile(pipeline, max_memo_size=100000):
+    """Compile pipeline to the minimal list of operations with the same result as step by step preprocessing
+
+    Notes
+    ----------
+
+    Operations:
+
+        ('call', step) – step function of preprocessing_mapper applied to the whole text
+        ('map', table) – str.translate table, adjacent char mapping steps are merged into one table
+        ('tokens', chain) – memoized function of token, adjacent token steps are fused into one pass over tokens
+
+    Sequential replacements of single chars are applied to every char independently,
+    so they are equal to one translate table, and the table can be applied to every token
+    when it keeps spaces. Every token step splits text by spaces and joins result by space,
+    so split between fused steps is applied to tokens only.
+
+    Example:
+
+        $ pipeline = ['tokenize', 'remove_special_chars', 'correct_spelling', 'remove_stopwords', 'remove_spaces']
+        $ program = [('call', tokenize), ('tokens', chain)]
+
+    """
+    program = []
+
+    for step in pipeline:
+        if step not in preprocessing_mapper:
+            continue
+
+        if step in token_steps and preprocessing_mapper[step] is getattr(TextPreprocessor, step):
+            if step == 'remove_stopwords' and len(utils.stopwords) == 0:
+                continue
+
+            _append_token_step(program, token_steps[step])
+        elif step in char_mapping_steps and preprocessing_mapper[step] is getattr(TextPreprocessor, step) \
+                and all(len(char) == 1 for char, _ in char_mapping_steps[step]()):
+            _append_char_mapping(program, char_mapping_steps[step]())
+        elif step == 'remove_spaces' and preprocessing_mapper[step] is TextPreprocessor.remove_spaces:
+            # replace special spaces, then strip and collapse spaces like split and join of tokens
+            _append_char_mapping(program, [(space, ' ') for space in utils.spaces])
+            _append_token_step(program, None)
+        else:
+            program.append(('call', preprocessing_mapper[step]))
+
+    return [
+        (operation, lru_cache(maxsize=max_memo_size)(partial(_apply_token_steps, tuple(arg))))
+        if operation == 'tokens' else (operation, arg)
+        for operation, arg in program
+    ]
+
+
+def _append_token_step(program, function):
+    if len(program) > 0 and program[-1][0] == 'tokens':
+        program[-1][1].append((function, True))
+    else:
+        program.append(('tokens', [(function, True)]))
+
+
+def _append_char_mapping(program, replacements):
+    # every char is mapped to the result of all replacements applied to it in order
+    table = {}
+    for char, _ in replacements:
+        mapped = char
+        for old, new in replacements:
+            mapped = mapped.replace(old, new)
+
+        table[ord(char)] = mapped
+
+    if len(program) > 0 and program[-1][0] == 'map':
+        previous = program[-1][1]
+        program[-1] = ('map', {
+            code: chr(code).translate(previous).translate(table) for code in set(previous) | set(table)
+        })
+    elif len(program) > 0 and program[-1][0] == 'tokens' and table.get(ord(' '), ' ') == ' ':
+        program[-1][1].append((lambda t: t.translate(table), False))
+    else:
+        program.append(('map', table))
+
+
+def _apply_token_steps(steps, token):
+    tokens = [token]
+
+    for function, splits in steps:
+        if splits:
+            tokens = [t for x in tokens for t in x.split()]
+
+        if function is not None:
+            tokens = [r for r in map(function, tokens) if r is not None]
+
+    return tuple(tokens)
@@ -0,0 +1,247 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from collections import OrderedDict
+
+from langdetect import detect, DetectorFactory
+from textblob import TextBlob
+
+# langdetect is random by default, fixed seed makes detection repeatable and results cacheable
+DetectorFactory.seed = 0
+
+# records propagate to logger of app ('project'), e.g. to its queue handler
+logger = logging.getLogger(__name__)
+
+"""english function words which are not words of other latin-script languages e.g. 'no', 'me', 'de' are not here,
+short pure-ASCII message with one of them is considered english without language detection"""
+english_words = frozenset([
+    'i', 'you', 'my', 'your', 'we', 'our', 'it', 'is', 'are', 'was', 'were', 'be', 'been', 'the', 'and', 'or',
+    'of', 'for', 'with', 'from', 'this', 'that', 'have', 'has', 'had', 'not', 'can', 'could', 'will', 'would',
+    'do', 'does', 'did', "don't", "can't", 'what', 'why', 'how', 'when', 'where', 'which', 'who', 'please',
+    'hello', 'thanks', 'thank', 'help', 'after', 'before', 'again', 'yet', 'still', 'got', 'get', 'any',
+])
+
+word_pattern = re.compile(r"[a-z']+")
+
+
+class OfflineBackend:
+    """Local stand-in of translation service, returns text as is without network calls"""
+
+    name = 'offline'
+
+    # text is returned as is in any language, so detection is skipped
+    needs_detection = False
+
+    def translate(self, text):
+        return text
+
+
+class TextBlobBackend:
+    """Translation by TextBlob, it calls Google Translate over the network"""
+
+    name = 'textblob'
+
+    needs_detection = True
+
+    def translate(self, text):
+        return str(TextBlob(text).translate())
+
+
+"""map backend names to their classes, name is used by TRANSLATION_BACKEND config"""
+translation_backends = {
+    OfflineBackend.name: OfflineBackend,
+    TextBlobBackend.name: TextBlobBackend,
+}
+
+
+class Translator:
+    """Class to translate non-english messages to english with cache of results
+
+    Short pure-ASCII messages with english function words are considered english without language detection,
+    other messages are detected by seeded langdetect and translated by backend.
+    Backend which doesn't translate (offline) returns messages as is without detection.
+    """
+
+    def __init__(self, backend=None, cache_path=None, max_size=10000, max_ascii_length=100):
+        """
+        Parameters
+        ----------
+        backend: OfflineBackend or TextBlobBackend, optional, default=None
+            object with translate method, backend=None means OfflineBackend
+        cache_path: str, optional, default=None
+            path to SQLite file to persist translations between restarts and workers,
+            None means memory cache only
+        max_size: int, optional, default=10000
+            max number of translations in process memory
+        max_ascii_length: int, optional, default=100
+            max length of pure-ASCII message with english function words to skip language detection,
+            0 turns fast path off
+
+        Attributes
+        ----------
+        hits : int
+            number of messages found in cache
+        misses : int
+            number of messages detected (and translated) by backend
+
+        """
+        self.backend = OfflineBackend() if backend is None else backend
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.max_ascii_length = max_ascii_length
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = None
+        self.connection_pid = None
+
+    def translate(self, text, detected=False):
+        """Method to translate message to english
+
+        Parameters
+        ----------
+        text: str, required
+            raw message
+        detected: bool, optional, default=False
+            True means message is already detected as non-english by ``needs_translation``,
+            so it's translated by backend without cache lookup and language detection
+
+        Returns
+        -------
+        translated_text
+            message in english, input message if it's english or translation fails
+
+        """
+        if self.__is_short_english(text):
+            return text
+
+        if not self.backend.needs_detection:
+            return self.backend.translate(text)
+
+        key = self.__key(text)
+
+        translated = None if detected else self.__get(key)
+        if translated is not None:
+            return translated
+
+        try:
+            translated = text if not detected and detect(text) == 'en' else self.backend.translate(text)
+        except Exception as e:
+            # e.g. no features in text to detect language or backend is unavailable, not cached
+            logger.warning(f'translation: failed: {e}')
+            return text
+
+        self.__put(key, translated)
+
+        return translated
+
+    def needs_translation(self, text):
+        """Detect whether message has to be translated by backend
+
+        Language detection is CPU-bound and translation by backend is I/O-bound, so async server detects
+        language with this method in CPU executor and translates by ``translate(text, detected=True)``
+        in I/O executor. English message is cached as its own translation.
+
+        Parameters
+        ----------
+        text: str, required
+            raw message
+
+        Returns
+        -------
+        bool
+            True if message is detected as non-english and its translation isn't cached
+
+        """
+        if self.__is_short_english(text):
+            return False
+
+        if not self.backend.needs_detection:
+            return False
+
+        key = self.__key(text)
+
+        if self.__get(key) is not None:
+            return False
+
+        try:
+            english = detect(text) == 'en'
+        except Exception:
+            # e.g. no features in text to detect language, ``translate`` returns message as is
+            return False
+
+        if english:
+            self.__put(key, text)
+
+        return not english
+
+    def stats(self):
+        """Get hit and miss counters of cache"""
+        with self.lock:
+            return {'backend': self.backend.name, 'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def __is_short_english(self, text):
+        # e.g. 'ich habe ein Problem mit der Zahlung' is pure-ASCII but has no english function words
+        return len(text) <= self.max_ascii_length and text.isascii() \
+            and not english_words.isdisjoint(word_pattern.findall(text.lower()))
+
+    def __key(self, text):
+        # the same message is translated differently by other backends
+        return hashlib.sha1(f'{self.backend.name}:{text}'.encode('utf-8')).hexdigest()
+
+    def __get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+
+                return self.entries[key]
+
+            row = None
+            if self.cache_path is not None:
+                row = self.__connection().execute('select value from translations where key = ?', (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__memory_put(key, row[0])
+
+            return row[0]
+
+    def __put(self, key, translated):
+        with self.lock:
+            self.__memory_put(key, translated)
+
+            if self.cache_path is not None:
+                connection = self.__connection()
+                connection.execute('insert or replace into translations values (?, ?)', (key, translated))
+                connection.commit()
+
+    def __memory_put(self, key, translated):
+        self.entries[key] = translated
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __connection(self):
+        # every worker process opens its own connection to the shared file, e.g. after gunicorn fork
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.cache_path, timeout=5, check_same_thread=False)
+            self.connection.execute('pragma journal_mode=wal')
+            self.connection.execute('create table if not exists translations (key text primary key, value text)')
+            self.connection.commit()
+
+            self.connection_pid = os.getpid()
+
+        return self.connection
@@ -2,13 +2,19 @@
 the first one logs to a file, and is a rotating handler. The second one will
 be the client logger which is what you see on the terminal. Their log levels
 are defined through .env file. These handlers are imported and attached to the
-app during app initiation stage."""
+app during app initiation stage by setup_queue_logging, which calls them
+from a background thread, so requests only put records to a queue."""
 
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from logging import StreamHandler
 from pathlib import Path
+import atexit
+import json
 import logging
 import os
+import queue
+import random
+import weakref
 
 # Logger setup
 # Set file paths for logger
@@ -35,3 +41,130 @@ file_logger.setFormatter(logger_formatter)
 client_logger = StreamHandler()
 client_logger.setLevel(logging.INFO)
 client_logger.setFormatter(logger_formatter)
+
+
+class SamplingFilter(logging.Filter):
+    """Filter to keep share of records of info level and below, warnings and errors are always kept"""
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        return record.levelno > logging.INFO or self.sample_rate >= 1 or random.random() < self.sample_rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatter of records to json lines with fields passed by extra, e.g. latency_ms of request"""
+
+    # attributes of every LogRecord, other attributes are added by extra
+    record_attributes = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        structured = {
+            'process': record.process,
+            'thread': record.threadName,
+            'time': self.formatTime(record),
+            'name': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+            **{k: v for k, v in vars(record).items() if k not in self.record_attributes}
+        }
+
+        if record.exc_info:
+            structured['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(structured, default=str)
+
+
+class ProcessQueueHandler(QueueHandler):
+    """Handler to put records to in-process queue, handlers are called by listener thread
+
+    Record is put to queue as is without formatting, so logging cost of request is a filter and an enqueue.
+    Listener is started by the first record of every process e.g. gunicorn worker of preloaded app,
+    so forked processes which don't log (e.g. preprocessing pool) don't start it.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(queue.SimpleQueue())
+
+        self.handlers = handlers
+        self.listener = None
+        self.listener_pid = None
+
+        _handlers.add(self)
+
+    def prepare(self, record):
+        # queue is never pickled, so message and args are formatted by listener thread
+        return record
+
+    def enqueue(self, record):
+        # called under lock of handler, logging reinitializes it in forked process
+        if self.listener_pid != os.getpid():
+            self.__start()
+
+        self.queue.put_nowait(record)
+
+    def stop(self):
+        _handlers.discard(self)
+
+        # listener thread of parent doesn't exist in forked process
+        if self.listener is not None and self.listener_pid == os.getpid():
+            self.listener.stop()
+
+        self.listener = None
+
+    def close(self):
+        self.stop()
+
+        super().close()
+
+    def __start(self):
+        # queue of parent is dropped with records which parent's listener didn't handle before fork
+        self.queue = queue.SimpleQueue()
+
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self.listener_pid = os.getpid()
+
+
+# handlers which aren't stopped yet, their listeners are stopped at exit by one hook of module
+_handlers = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_handlers():
+    for handler in list(_handlers):
+        handler.stop()
+
+
+def setup_queue_logging(logger, sample_rate=1.0, level=logging.INFO):
+    """Replace handlers of logger by queue handler writing to file and client handlers in background thread
+
+    Parameters
+    ----------
+    logger: logging.Logger, required
+        logger to set up, e.g. app.logger
+    sample_rate: float, optional, default=1.0
+        share of info records to keep
+    level: int, optional, default=logging.INFO
+        level of logger
+
+    """
+    file_logger.setFormatter(StructuredFormatter())
+
+    handler = ProcessQueueHandler([file_logger, client_logger])
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+
+        # queue handler of previous app stops its listener after handling queued records,
+        # file and client handlers are shared by queue handlers, so they're not closed
+        if isinstance(h, ProcessQueueHandler):
+            h.close()
+
+    logger.addHandler(handler)
+    logger.setLevel(level)
+
+    return handler
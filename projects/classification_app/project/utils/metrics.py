@@ -0,0 +1,258 @@
+"""Used for collecting request and inference metrics of the app and exposing them
+in Prometheus text format. Every process keeps its own counters and histograms
+and flushes them to a json file of metrics directory, so any gunicorn worker
+serving /metrics sums the files of all workers."""
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from flask import g, request, Response
+
+"""upper bounds of histogram buckets in seconds as default buckets of Prometheus clients"""
+default_buckets = [0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10]
+
+"""type and help of every metric"""
+metric_definitions = {
+    'http_requests_total': ('counter', 'Number of HTTP requests by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Latency of HTTP requests by endpoint and method'),
+    'model_inference_duration_seconds': ('histogram', 'Latency of MessageCategorizer predictions by method'),
+    'model_inference_messages_total': ('counter', 'Number of messages predicted by MessageCategorizer by method'),
+}
+
+
+class Metrics:
+    """Class to collect counters and histograms of process and aggregate them between processes"""
+
+    def __init__(self, path=None, flush_interval=1.0):
+        """
+        Parameters
+        ----------
+        path: str, optional, default=None
+            directory of metrics files shared by processes, None means metrics of current process only
+        flush_interval: float, optional, default=1.0
+            seconds between flushes of process metrics to its file
+
+        Attributes
+        ----------
+        counters : dict of tuple: float
+            value by metric name and labels
+        histograms : dict of tuple: dict
+            bucket counts, sum and count by metric name and labels
+
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+        self.thread = None
+        self.thread_pid = None
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            _remove_dead_process_files(path)
+
+    def inc(self, name, labels, value=1):
+        """Increase counter, labels is tuple of (label, value) pairs"""
+        self.__start()
+
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def observe(self, name, labels, value):
+        """Add value to histogram, labels is tuple of (label, value) pairs"""
+        self.__start()
+
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+
+            if histogram is None:
+                histogram = {'buckets': [0] * (len(default_buckets) + 1), 'sum': 0.0, 'count': 0}
+                self.histograms[(name, labels)] = histogram
+
+            histogram['buckets'][bisect.bisect_left(default_buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def observe_inference(self, method, seconds, num_of_messages):
+        """Record one call of MessageCategorizer method"""
+        labels = (('method', method),)
+
+        self.observe('model_inference_duration_seconds', labels, seconds)
+        self.inc('model_inference_messages_total', labels, num_of_messages)
+
+    def render(self):
+        """Get metrics of all processes in Prometheus text format"""
+        counters, histograms = self.__aggregate()
+
+        lines = []
+        for name, (metric_type, help_text) in metric_definitions.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(default_buckets + ['+Inf'], histogram['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+
+                lines.append(f'{name}_sum{_labels(labels)} {histogram["sum"]}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """Write metrics of current process to its file"""
+        if self.path is None:
+            return
+
+        with self.lock:
+            snapshot = {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, histogram] for (name, labels), histogram in self.histograms.items()],
+            }
+
+        file_path = os.path.join(self.path, f'metrics_{os.getpid()}.json')
+
+        with open(file_path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+
+        os.replace(file_path + '.tmp', file_path)
+
+    def __aggregate(self):
+        if self.path is None:
+            with self.lock:
+                return dict(self.counters), {key: dict(h, buckets=list(h['buckets'])) for key, h in self.histograms.items()}
+
+        self.flush()
+
+        counters = {}
+        histograms = {}
+
+        for file_path in glob.glob(os.path.join(self.path, 'metrics_*.json')):
+            try:
+                with open(file_path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                # file of process removed or replaced while reading
+                continue
+
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+
+            for name, labels, histogram in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+
+                if key not in histograms:
+                    histograms[key] = {'buckets': [0] * (len(default_buckets) + 1), 'sum': 0.0, 'count': 0}
+
+                histograms[key]['buckets'] = [a + b for a, b in zip(histograms[key]['buckets'], histogram['buckets'])]
+                histograms[key]['sum'] += histogram['sum']
+                histograms[key]['count'] += histogram['count']
+
+        return counters, histograms
+
+    def __start(self):
+        # flush thread is started lazily in the process which serves requests, e.g. in gunicorn worker after fork,
+        # metrics inherited from parent process are dropped as they are already counted in file of parent
+        if self.path is None or self.thread_pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.thread_pid != os.getpid():
+                if self.thread_pid is not None:
+                    self.counters = {}
+                    self.histograms = {}
+
+                self.thread = threading.Thread(target=self.__run, name='metrics-flusher', daemon=True)
+                self.thread.start()
+                self.thread_pid = os.getpid()
+
+    def __run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+def init_metrics(app, metrics):
+    """Register request hooks collecting metrics of every request and /metrics endpoint"""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'metrics_start' in g:
+            endpoint = request.endpoint or 'unknown'
+
+            metrics.inc('http_requests_total', (
+                ('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))))
+            metrics.observe('http_request_duration_seconds', (
+                ('endpoint', endpoint), ('method', request.method)), time.perf_counter() - g.metrics_start)
+
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def temporary_metrics_dir():
+    """Create metrics directory of current process and its forked workers, it's removed when the process exits
+
+    Notes
+    ----------
+
+    Directory is shared only by workers forked after its creation, e.g. by gunicorn --preload,
+    servers which create app in every worker need common METRICS_DIR.
+    """
+    path = tempfile.mkdtemp(prefix='classification_app_metrics_')
+    pid = os.getpid()
+
+    def remove():
+        # forked workers inherit exit hooks, directory is removed by the process which created it
+        if os.getpid() == pid:
+            shutil.rmtree(path, ignore_errors=True)
+
+    atexit.register(remove)
+
+    return path
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}' if len(labels) > 0 else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _remove_dead_process_files(path):
+    # files of finished processes, e.g. of the previous run, would be summed forever
+    for file_path in glob.glob(os.path.join(path, 'metrics_*.json')):
+        pid = int(os.path.basename(file_path)[len('metrics_'):-len('.json')])
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            os.remove(file_path)
+        except PermissionError:
+            pass
@@ -0,0 +1,50 @@
+import logging
+import threading
+
+from project.utils.logging import setup_queue_logging
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def listener_threads():
+    return [t for t in threading.enumerate() if t.name.endswith('(_monitor)')]
+
+
+def test_repeated_setup_stops_previous_listener():
+    logger = logging.getLogger('test_repeated_setup')
+    logger.propagate = False
+    before = len(listener_threads())
+
+    for _ in range(3):
+        handler = setup_queue_logging(logger)
+        logger.warning('setup')
+
+    assert logger.handlers == [handler]
+    assert len(listener_threads()) == before + 1
+
+    handler.close()
+    assert len(listener_threads()) == before
+
+
+def test_replaced_handler_handles_queued_records():
+    logger = logging.getLogger('test_replaced_handler')
+    logger.propagate = False
+
+    records = []
+    handler = setup_queue_logging(logger)
+    handler.handlers = [RecordingHandler(records)]
+
+    logger.warning('first')
+    logger.warning('second')
+    setup_queue_logging(logger).close()
+
+    assert handler.listener is None
+    assert [r.getMessage() for r in records] == ['first', 'second']
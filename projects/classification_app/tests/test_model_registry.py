@@ -0,0 +1,29 @@
+import os
+
+from project.ml.model_registry import ModelRegistry
+
+
+def test_prepare_is_not_counted_in_load_time(tmp_path):
+    os.makedirs(tmp_path / 'model')
+    (tmp_path / 'model' / 'v1.txt').write_text('weights')
+
+    prepared = []
+
+    def prepare(key, version, path, model):
+        # e.g. process-wide resources loaded by warm-up of the first model
+        prepared.append((key, version, os.path.basename(path), model))
+        prepared.extend(bytearray(10 ** 6))
+
+    registry = ModelRegistry(lambda key, version, path: open(path).read(), path=str(tmp_path),
+                             reload_interval=0, prepare=prepare)
+
+    assert registry.get('model') == 'weights'
+    assert prepared[0] == ('model', 'v1', 'v1.txt', 'weights')
+
+    load = registry.stats()['model']['loaded']['v1']
+    assert load['prepare_seconds'] > load['load_seconds']
+    assert load['memory'] is None or load['memory'] < 10 ** 6
+
+    # loaded model is prepared once
+    registry.get('model', 'v1')
+    assert len(prepared) == 10 ** 6 + 1
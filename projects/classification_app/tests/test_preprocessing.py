@@ -0,0 +1,36 @@
+import json
+import os
+
+import nltk
+import pytest
+
+from project.ml.text_preprocessing import TextPreprocessor
+
+corpus_path = os.path.join(
+    os.path.dirname(__file__), os.pardir, 'project', 'ml', 'storage', 'text_preprocessing', 'golden_corpus.jsonl')
+
+with open(corpus_path, encoding='utf-8') as f:
+    corpus = [json.loads(line) for line in f if line.strip() != '']
+
+
+@pytest.fixture(scope='module')
+def preprocessor():
+    # tokenize step needs nltk data listed in nltk.txt
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        pytest.skip('nltk punkt_tab data is not installed')
+
+    return TextPreprocessor()
+
+
+def test_every_text_has_expected_result():
+    assert [item['text'] for item in corpus if 'expected' not in item] == []
+
+
+@pytest.mark.parametrize('item', corpus, ids=range(len(corpus)))
+def test_compiled_pipeline_equals_stepwise_and_expected(preprocessor, item):
+    stepwise = preprocessor.preprocess_stepwise(item['text'])
+
+    assert preprocessor.preprocess(item['text']) == stepwise
+    assert stepwise == item.get('expected')
@@ -0,0 +1,60 @@
+import logging
+
+from project.ml.translation import Translator, OfflineBackend
+
+
+class RecordingBackend:
+    """Backend which needs detection and records translated messages instead of network calls"""
+
+    name = 'recording'
+    needs_detection = True
+
+    def __init__(self, error=None):
+        self.error = error
+        self.translated = []
+
+    def translate(self, text):
+        if self.error is not None:
+            raise self.error
+
+        self.translated.append(text)
+        return f'translated: {text}'
+
+
+def test_short_english_messages_skip_detection():
+    translator = Translator(backend=RecordingBackend())
+
+    for text in ['hello xsolla, i have problems with epic store payments', 'How do I change the e-mail on my account?']:
+        assert not translator.needs_translation(text)
+        assert translator.translate(text) == text
+
+    # neither cache lookup nor detection happened
+    assert translator.stats()['misses'] == 0
+
+
+def test_latin_script_non_english_messages_are_translated():
+    backend = RecordingBackend()
+    translator = Translator(backend=backend)
+
+    text = 'ich habe ein Problem mit der Zahlung'
+
+    assert translator.needs_translation(text)
+    assert translator.translate(text, detected=True) == f'translated: {text}'
+    assert translator.translate(text) == f'translated: {text}'
+    assert backend.translated == [text]
+
+
+def test_offline_backend_never_translates():
+    translator = Translator(backend=OfflineBackend())
+
+    assert not translator.needs_translation('ich habe ein Problem mit der Zahlung')
+    assert translator.translate('Привет, у меня проблема с оплатой') == 'Привет, у меня проблема с оплатой'
+
+
+def test_failed_translation_is_logged(caplog):
+    translator = Translator(backend=RecordingBackend(error=ConnectionError('service is unavailable')))
+
+    with caplog.at_level(logging.WARNING, logger='project.ml.translation'):
+        assert translator.translate('Привет, у меня проблема с оплатой') == 'Привет, у меня проблема с оплатой'
+
+    assert 'service is unavailable' in caplog.text
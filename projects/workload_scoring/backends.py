@@ -0,0 +1,413 @@
+"""
+This module provides data backends to read source table and write results of WorkloadScoring.
+
+Supported backends:
+
+- BigQueryBackend – BigQuery tables through pandas-gbq (default)
+- CsvBackend – CSV files at ``{path}/{dataset_id}/{table_id}.csv``
+- ParquetBackend – Parquet file or directory of part files at ``{path}/{dataset_id}/{table_id}.parquet``
+- SqliteBackend – tables of SQLite files at ``{path}/{dataset_id}.sqlite``
+
+Notes
+-----
+
+Every backend reads the same source schema as BigQuery table: id, created_at, updated_at and grouping columns,
+and returns the same dataframe as ``WorkloadScoring.read_table``: id, created, updated and grouping columns
+ordered by updated. Column selection and filters ``column in (...)``, ``updated >= ...`` are applied
+while reading, so records out of filters are never loaded at once.
+
+Every backend also reads records by chunks of rows with ``read_chunks``, it's used by
+``WorkloadScoring.workload_scoring_stream`` to never hold the whole table in memory.
+
+[!] BigQueryBackend requires google-auth and pandas-gbq, file backends work without GCP.
+
+"""
+
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+try:
+    from google.oauth2.service_account import Credentials
+    from google.cloud import bigquery
+    import pandas_gbq
+except ImportError:
+    Credentials = None
+    bigquery = None
+    pandas_gbq = None
+
+try:
+    import pyarrow.dataset as pyarrow_dataset
+except ImportError:
+    pyarrow_dataset = None
+
+
+class DataBackend:
+    """Base class of data backends, subclasses implement reading and writing of tables
+    """
+
+    def query(self, dataset_id, table_id, columns, updated_since=None):
+        """Get text of query, it's used as cache key of ``QueryCache``
+
+        Parameters
+        ----------
+        dataset_id: str, required
+            dataset that contains tables
+        table_id: str, required
+            table which use to query data
+        columns: dict of str: list of obj, required
+            columns for grouping records and their allowed values as in ``WorkloadScoring.read_table``
+        updated_since: str, optional, default=None
+            read only records updated since this date in schema 'y-m-d' (inclusive)
+
+        """
+        return json.dumps([type(self).__name__, self.location(dataset_id, table_id), columns, updated_since],
+                          default=str)
+
+    def read(self, dataset_id, table_id, columns, updated_since=None):
+        """Read records of table, parameters are the same as in ``query``"""
+        raise NotImplementedError
+
+    def read_chunks(self, dataset_id, table_id, columns, updated_since=None, chunksize=100000):
+        """Read records of table by chunks of at most chunksize rows, each chunk has schema of ``read``
+
+        Chunks are ordered by updated inside, but not between each other for file backends.
+        Default implementation reads the whole table as one chunk.
+        """
+        yield self.read(dataset_id, table_id, columns, updated_since)
+
+    def column_types(self, dataset_id, table_id, columns):
+        """Get dtypes of destination table columns to cast written data, None if table has no fixed schema"""
+        return None
+
+    def write(self, df, dataset_id, table_id, chunksize=None):
+        """Append dataframe to destination table by one load, or by loads of chunksize rows if it's set"""
+        raise NotImplementedError
+
+    def location(self, dataset_id, table_id):
+        return f'{dataset_id}.{table_id}'
+
+    def cache_key(self, dataset_id, table_id):
+        """Get backend type and location of table, cached results of one table are used by the same backend only"""
+        return f'{type(self).__name__}:{self.location(dataset_id, table_id)}'
+
+
+class BigQueryBackend(DataBackend):
+    """Backend to read and write BigQuery tables
+    """
+
+    def __init__(self, credentials):
+        """
+
+        Parameters
+        ----------
+        credentials: dict of str: str, required
+            required fields: https://google-auth.readthedocs.io/en/latest/user-guide.html
+
+        Attributes
+        ----------
+        project_id: str
+            GCP project_id where placed BigQuery dataset and tables
+        credentials: Credentials
+            service account credentials
+
+        """
+
+        if pandas_gbq is None:
+            raise ImportError('BigQueryBackend requires google-auth and pandas-gbq')
+
+        self.project_id = credentials['project_id']
+
+        self.credentials = Credentials.from_service_account_info(credentials)
+
+    def query(self, dataset_id, table_id, columns, updated_since=None):
+        where_statement = []
+        from_statement = f"from `{dataset_id}.{table_id}`"
+        select_statement = "select id, date(cast(created_at as datetime)) as created, " \
+                           "date(cast(updated_at as datetime)) as updated"
+
+        if columns is not None:
+            select_statement = select_statement + ", " + ", ".join(columns.keys())
+
+            for c, v in columns.items():
+                if len(v) > 0:
+                    val_enum = ", ".join([f"'{x}'" for x in v])
+                    where_statement.append(f'{c} in ({val_enum})')
+
+        if updated_since is not None:
+            where_statement.append(f"date(cast(updated_at as datetime)) >= '{updated_since}'")
+
+        where_statement = "where " + " and ".join(where_statement) if len(where_statement) > 0 else ""
+
+        return " ".join([
+            select_statement,
+            from_statement,
+            where_statement,
+            "ORDER BY updated"
+        ])
+
+    def location(self, dataset_id, table_id):
+        # query doesn't name project, so the same query of other project is other table
+        return f'{self.project_id}.{dataset_id}.{table_id}'
+
+    def read(self, dataset_id, table_id, columns, updated_since=None):
+        return pandas_gbq.read_gbq(
+            self.query(dataset_id, table_id, columns, updated_since),
+            project_id=self.project_id,
+            credentials=self.credentials
+        )
+
+    def read_chunks(self, dataset_id, table_id, columns, updated_since=None, chunksize=100000):
+        client = bigquery.Client(project=self.project_id, credentials=self.credentials)
+
+        rows = client.query(self.query(dataset_id, table_id, columns, updated_since)).result(page_size=chunksize)
+
+        # every page of query result is fetched from storage on demand
+        for df in rows.to_dataframe_iterable():
+            yield df
+
+    def column_types(self, dataset_id, table_id, columns):
+        return dict(pandas_gbq.read_gbq(
+            f"select {', '.join(columns)} from `{dataset_id}.{table_id}` limit 0",
+            project_id=self.project_id,
+            credentials=self.credentials
+        ).dtypes)
+
+    def write(self, df, dataset_id, table_id, chunksize=None):
+        pandas_gbq.to_gbq(
+            df,
+            project_id=self.project_id,
+            destination_table=f'{dataset_id}.{table_id}',
+            credentials=self.credentials,
+            chunksize=chunksize,
+            if_exists='append'
+        )
+
+
+class CsvBackend(DataBackend):
+    """Backend to read and write CSV files, source is read by chunks filtered on the fly
+    """
+
+    def __init__(self, path, chunksize=100000):
+        """
+
+        Parameters
+        ----------
+        path: str, required
+            root directory of files
+        chunksize: int, optional, default=100000
+            number of rows read at once
+
+        """
+
+        self.path = path
+        self.chunksize = chunksize
+
+    def location(self, dataset_id, table_id):
+        return os.path.join(self.path, dataset_id, f'{table_id}.csv')
+
+    def read(self, dataset_id, table_id, columns, updated_since=None):
+        return _concat(self.read_chunks(dataset_id, table_id, columns, updated_since, self.chunksize), columns)
+
+    def read_chunks(self, dataset_id, table_id, columns, updated_since=None, chunksize=None):
+        columns = columns or {}
+
+        chunks = pd.read_csv(
+            self.location(dataset_id, table_id),
+            usecols=['id', 'created_at', 'updated_at'] + list(columns),
+            chunksize=chunksize or self.chunksize
+        )
+
+        for chunk in chunks:
+            yield _to_raw_df(_filter(chunk, columns, updated_since), columns)
+
+    def write(self, df, dataset_id, table_id, chunksize=None):
+        file_path = self.location(dataset_id, table_id)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        df.to_csv(file_path, mode='a', header=not os.path.exists(file_path), index=False, chunksize=chunksize)
+
+
+class ParquetBackend(DataBackend):
+    """Backend to read and write Parquet files, filters are pushed down to pyarrow reader
+    """
+
+    def __init__(self, path):
+        """
+
+        Parameters
+        ----------
+        path: str, required
+            root directory of files
+
+        """
+
+        self.path = path
+
+    def location(self, dataset_id, table_id):
+        return os.path.join(self.path, dataset_id, f'{table_id}.parquet')
+
+    def read(self, dataset_id, table_id, columns, updated_since=None):
+        columns = columns or {}
+        filters = [(c, 'in', list(v)) for c, v in columns.items() if len(v) > 0]
+
+        df = pd.read_parquet(
+            self.location(dataset_id, table_id),
+            columns=['id', 'created_at', 'updated_at'] + list(columns),
+            filters=filters if len(filters) > 0 else None
+        )
+
+        return _to_raw_df(_filter(df, {}, updated_since), columns)
+
+    def read_chunks(self, dataset_id, table_id, columns, updated_since=None, chunksize=100000):
+        columns = columns or {}
+
+        condition = None
+        for c, v in columns.items():
+            if len(v) > 0:
+                in_values = pyarrow_dataset.field(c).isin(list(v))
+                condition = in_values if condition is None else condition & in_values
+
+        batches = pyarrow_dataset.dataset(self.location(dataset_id, table_id), format='parquet').to_batches(
+            columns=['id', 'created_at', 'updated_at'] + list(columns),
+            filter=condition,
+            batch_size=chunksize
+        )
+
+        for batch in batches:
+            yield _to_raw_df(_filter(batch.to_pandas(), {}, updated_since), columns)
+
+    def column_types(self, dataset_id, table_id, columns):
+        file_path = self.location(dataset_id, table_id)
+
+        if not os.path.exists(file_path):
+            return None
+
+        schema = pyarrow_dataset.dataset(file_path, format='parquet').schema
+
+        return dict(schema.empty_table().select(list(columns)).to_pandas().dtypes)
+
+    def write(self, df, dataset_id, table_id, chunksize=None):
+        """Append dataframe as new part file of table directory, existing parts are never read or rewritten"""
+        directory = self.location(dataset_id, table_id)
+
+        if os.path.isfile(directory):
+            # table written as one file is moved to directory as its first part
+            os.replace(directory, directory + '.tmp')
+            os.makedirs(directory)
+            os.replace(directory + '.tmp', os.path.join(directory, 'part-00000.parquet'))
+
+        os.makedirs(directory, exist_ok=True)
+
+        part = f'part-{len(os.listdir(directory)):05d}.parquet'
+
+        # readers skip hidden files, so part is visible only when it's written completely
+        df.to_parquet(os.path.join(directory, '.' + part), index=False, row_group_size=chunksize)
+        os.replace(os.path.join(directory, '.' + part), os.path.join(directory, part))
+
+
+class SqliteBackend(DataBackend):
+    """Backend to read and write tables of SQLite files, filters are applied by SQLite query
+    """
+
+    def __init__(self, path):
+        """
+
+        Parameters
+        ----------
+        path: str, required
+            directory of SQLite files, one file per dataset
+
+        """
+
+        self.path = path
+
+    def location(self, dataset_id, table_id):
+        return os.path.join(self.path, f'{dataset_id}.sqlite')
+
+    def read(self, dataset_id, table_id, columns, updated_since=None):
+        return _concat(self.read_chunks(dataset_id, table_id, columns, updated_since, chunksize=None), columns)
+
+    def read_chunks(self, dataset_id, table_id, columns, updated_since=None, chunksize=100000):
+        columns = columns or {}
+
+        where_statement = []
+        params = []
+
+        for c, v in columns.items():
+            if len(v) > 0:
+                where_statement.append(f"{_quote(c)} in ({', '.join(['?'] * len(v))})")
+                params.extend(v)
+
+        if updated_since is not None:
+            where_statement.append('date(updated_at) >= ?')
+            params.append(str(updated_since))
+
+        sql = " ".join([
+            "select id, date(created_at) as created, date(updated_at) as updated",
+            "".join(f", {_quote(c)}" for c in columns),
+            f"from {_quote(table_id)}",
+            "where " + " and ".join(where_statement) if len(where_statement) > 0 else "",
+            "order by updated"
+        ])
+
+        connection = sqlite3.connect(self.location(dataset_id, table_id))
+        try:
+            chunks = pd.read_sql_query(sql, connection, params=params, chunksize=chunksize)
+
+            for df in [chunks] if chunksize is None else chunks:
+                df['created'] = pd.to_datetime(df.created)
+                df['updated'] = pd.to_datetime(df.updated)
+
+                yield df
+        finally:
+            connection.close()
+
+    def write(self, df, dataset_id, table_id, chunksize=None):
+        os.makedirs(self.path, exist_ok=True)
+
+        connection = sqlite3.connect(self.location(dataset_id, table_id))
+        try:
+            df.to_sql(table_id, connection, if_exists='append', index=False, chunksize=chunksize)
+        finally:
+            connection.close()
+
+
+def _filter(df, columns, updated_since):
+    mask = pd.Series(True, index=df.index)
+
+    for c, v in columns.items():
+        if len(v) > 0:
+            mask &= df[c].astype(str).isin([str(x) for x in v])
+
+    if updated_since is not None:
+        mask &= pd.to_datetime(df.updated_at).dt.normalize() >= pd.Timestamp(updated_since)
+
+    return df[mask]
+
+
+def _to_raw_df(df, columns):
+    """Convert source records to schema of ``WorkloadScoring.raw_df`` ordered by updated"""
+    raw_df = pd.DataFrame({
+        'id': df.id,
+        'created': pd.to_datetime(df.created_at).dt.normalize(),
+        'updated': pd.to_datetime(df.updated_at).dt.normalize(),
+        **{c: df[c] for c in columns}
+    })
+
+    return raw_df.sort_values('updated', kind='stable').reset_index(drop=True)
+
+
+def _concat(chunks, columns):
+    chunks = list(chunks)
+
+    if len(chunks) == 0:
+        return _to_raw_df(pd.DataFrame(columns=['id', 'created_at', 'updated_at'] + list(columns or {})), columns or {})
+
+    return pd.concat(chunks).sort_values('updated', kind='stable').reset_index(drop=True)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
@@ -0,0 +1,192 @@
+"""
+This module provides class DailyCountStore to persist per group per day counts of unique tasks at local SQLite file.
+
+Store is used by ``WorkloadScoring.workload_scoring_incremental`` to read only new records from BigQuery
+and calculate scores by stored counts instead of the whole history.
+
+Notes
+-----
+
+Store contains tables:
+
+- tasks: the last known group and day of every task, used to move task between days when it's updated again
+- daily_counts: number of unique tasks per group per day
+- meta: grouping columns the store was created with
+
+[!] One store supports one set of grouping columns, create another file for another set.
+
+"""
+
+import sqlite3
+import json
+
+import pandas as pd
+
+
+class DailyCountStore:
+    """Class to persist per group per day counts of unique tasks at SQLite file
+    """
+
+    def __init__(self, path, columns_list):
+        """
+
+        Parameters
+        ----------
+        path: str, required
+            path to SQLite file, it's created if not exists
+        columns_list: list of str, required
+            columns for grouping records e.g. group by column1, column2 etc.
+
+        Attributes
+        ----------
+        columns_list : list of str
+            columns for grouping records
+        connection : sqlite3.Connection
+            connection to SQLite file
+
+        """
+
+        self.columns_list = list(columns_list)
+        self.connection = sqlite3.connect(path)
+
+        self.__create_tables()
+
+    def watermark(self):
+        """Get the last day of stored tasks in schema 'y-m-d', None if store is empty"""
+        return self.connection.execute('select max(day) from tasks').fetchone()[0]
+
+    def merge(self, raw_df):
+        """Merge records into store
+
+        Parameters
+        ----------
+        raw_df: dataframe, required
+            records with columns id, updated and grouping columns as ``WorkloadScoring.raw_df``
+
+        Notes
+        ----------
+
+        Every task keeps the only record with the last updated day. If task is already in store,
+        it's subtracted from the counts of its previous group and day and added to the new ones.
+
+        Example:
+
+            tasks before merge:         id 1, assignee_id 1, day 2017-04-01
+            record to merge:            id 1, assignee_id 2, day 2017-04-03
+
+            daily_counts changes:       (1, 2017-04-01) -1, (2, 2017-04-03) +1
+
+        """
+
+        keys = self.columns_list + ['day']
+        quoted = ', '.join(_quote(c) for c in ['id'] + keys)
+
+        tasks = raw_df.dropna(subset=self.columns_list + ['id', 'updated'])
+        tasks = pd.DataFrame({
+            'id': tasks.id,
+            **{c: tasks[c] for c in self.columns_list},
+            'day': pd.to_datetime(tasks.updated).dt.strftime('%Y-%m-%d')
+        })
+        tasks = tasks.sort_values('day', kind='stable').drop_duplicates('id', keep='last')
+
+        # one transaction for temp table, counts and tasks (their max day is the watermark),
+        # so failed merge leaves store as before it
+        with self.connection:
+            self.connection.execute('begin')
+            self.connection.execute(f'create temp table new_tasks ({quoted})')
+            self.connection.executemany(
+                f"insert into new_tasks values ({', '.join(['?'] * (len(keys) + 1))})",
+                _records(tasks)
+            )
+
+            old_tasks = pd.read_sql_query(
+                f'select {", ".join("t." + _quote(c) for c in ["id"] + keys)} '
+                f'from tasks t join new_tasks n on t.id = n.id',
+                self.connection
+            )
+
+            delta = pd.concat([
+                tasks.assign(num_of_tasks=1),
+                old_tasks.assign(num_of_tasks=-1)
+            ]).groupby(keys).num_of_tasks.sum().reset_index()
+
+            delta = delta[delta.num_of_tasks != 0]
+
+            self.connection.executemany(
+                f"insert into daily_counts values ({', '.join(['?'] * (len(keys) + 1))}) "
+                f"on conflict ({', '.join(_quote(c) for c in keys)}) "
+                f"do update set num_of_tasks = num_of_tasks + excluded.num_of_tasks",
+                _records(delta)
+            )
+            self.connection.execute('delete from daily_counts where num_of_tasks <= 0')
+
+            self.connection.execute(f'insert or replace into tasks select {quoted} from new_tasks')
+            self.connection.execute('drop table new_tasks')
+
+    def read_daily_counts(self, since=None):
+        """Read per group per day counts of unique tasks
+
+        Parameters
+        ----------
+        since: str or date, optional, default=None
+            read counts of days since this date (inclusive), groups of earlier days are
+            returned with day None and num_of_tasks 0 to keep the same groups as in the whole history
+
+        Returns
+        -------
+        daily_df
+            dataframe with grouping columns, day and num_of_tasks
+        """
+
+        columns = ', '.join(_quote(c) for c in self.columns_list)
+
+        if since is None:
+            return pd.read_sql_query(f'select {columns}, day, num_of_tasks from daily_counts', self.connection)
+
+        since = pd.Timestamp(since).strftime('%Y-%m-%d')
+
+        return pd.read_sql_query(
+            f'select {columns}, day, num_of_tasks from daily_counts where day >= ? '
+            f'union all '
+            f'select distinct {columns}, null, 0 from daily_counts where day < ?',
+            self.connection,
+            params=(since, since)
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __create_tables(self):
+        columns = ', '.join(_quote(c) for c in self.columns_list)
+
+        with self.connection:
+            self.connection.execute('create table if not exists meta (key text primary key, value text)')
+            self.connection.execute(f'create table if not exists tasks (id primary key, {columns}, day text)')
+            self.connection.execute(
+                f'create table if not exists daily_counts ({columns}, day text, num_of_tasks integer, '
+                f'primary key ({columns}, day))'
+            )
+
+            self.connection.execute(
+                "insert or ignore into meta values ('columns_list', ?)", (json.dumps(self.columns_list),))
+
+        stored_columns = json.loads(
+            self.connection.execute("select value from meta where key = 'columns_list'").fetchone()[0])
+
+        if stored_columns != self.columns_list:
+            raise ValueError(f'store was created with columns {stored_columns}, got {self.columns_list}')
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _records(df):
+    """Convert dataframe rows to tuples of python objects accepted by sqlite3"""
+    return list(df.astype(object).itertuples(index=False, name=None))
@@ -23,7 +23,7 @@ if __name__ == '__main__':
     }
 
     # load dataframe with specify dataset and table
-    ws.read_table(dataset_id, read_table_id, table_columns)
+    ws.read_table(dataset_id, read_table_id, table_columns, compact=True)
 
     # calculate workload score in terms of columns and period
     ws.workload_scoring(
@@ -72,7 +72,7 @@ if __name__ == '__main__':
         'status': ['closed', 'solved'],
     }
 
-    ws.read_table(dataset_id, read_table_id, table_columns)
+    ws.read_table(dataset_id, read_table_id, table_columns, compact=True)
 
     ws.workload_scoring(
         columns_list=list(table_columns.keys()),
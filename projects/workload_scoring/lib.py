@@ -7,6 +7,14 @@ Supported features:
 - grouping records by categorical features e.g. group by column1, column2 etc.
 - managing historical period for calculations e.g. last 28 days
 - workload scoring calculation based on confidence interval
+- vectorized scoring engine with legacy loop engine kept for verification
+- batch scoring of many windows e.g. backfill by single pass over data
+- incremental scoring by daily counts persisted at local SQLite store
+- local Parquet cache of read_table results
+- pluggable data backends: BigQuery, CSV, Parquet, SQLite files for offline runs
+- streaming scoring by chunks of table with bounded memory
+- compact integer-encoded representation of loaded table
+- parallel scoring of group partitions by process pool
 - approaches to calculate scoring based on machine learning [in progress]
 
 Notes
@@ -18,12 +26,20 @@ Notes
 
 [!] Library uses dotenv to safely store security-sensitive data.
 
+[!] Library uses pyarrow to cache query results at Parquet files.
+
 Using
 -------
 - create account object by passing credentials to create WorkloadScoring instance
+- optionally pass ``QueryCache`` to WorkloadScoring instance to reuse results of ``read_table`` between calls and runs
+- optionally pass backend e.g. ``CsvBackend`` instead of credentials to work with local files
 - read BigQuery table by ``read_table`` method passing the necessary columns to split records
 - calculate assignee workload score by ``workload_scoring`` method passing the time intervals and columns for grouping
+- calculate scores for several windows or backfill end dates at once by ``workload_scoring_batch`` method
+- update persisted daily counts by new records only and calculate scores by ``workload_scoring_incremental`` method
+- calculate scores of huge table by chunks without loading it by ``workload_scoring_stream`` method
 - write BigQuery table by ``write_table`` method passing the columns to save as your schema supposes
+- queue several results by ``write_table(..., queue=True)`` and write them by one load per table by ``flush_tables``
 
 Example
 -------
@@ -39,29 +55,536 @@ Run examples from ``examples.py``
 
 """
 
-from google.oauth2.service_account import Credentials
-
-import pandas_gbq
-
 import numpy as np
 import pandas as pd
 import math as mt
 import datetime as dt
 
 import itertools as it
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from backends import BigQueryBackend
+from daily_store import DailyCountStore
+
+
+# compact raw_df stores dates as int32 number of days since epoch, missing date is min int32
+_EPOCH = pd.Timestamp('1970-01-01')
+_MISSING_DAY = np.iinfo(np.int32).min
+
+
+def _start_date(end_date, num_of_all_days):
+    end_date = dt.datetime.strptime(str(end_date), '%Y-%m-%d').date()
+
+    return end_date - dt.timedelta(days=num_of_all_days)
+
+
+def _column_codes(df, columns_list, keys=None):
+    """Encode values of every grouping column as position in its unique values
+
+    Unique values are taken in order of ``Series.unique`` and extended by new values from ``keys``.
+    Rows with missing values get code -1, they never match any group.
+    """
+    col_unique_vals = []
+    col_codes = []
+    key_codes = []
+
+    for column in columns_list:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            vals, codes = _categorical_codes(df[column])
+        else:
+            vals = df[column].unique()
+            codes = None
+
+        if keys is not None:
+            vals = pd.concat([pd.Series(vals), keys[column]], ignore_index=True).unique()
+            key_codes.append(pd.Index(vals).get_indexer(keys[column]))
+
+        if codes is None:
+            codes = pd.Index(vals).get_indexer(df[column])
+            codes[df[column].isna().to_numpy()] = -1
+
+        col_unique_vals.append(vals)
+        col_codes.append(codes)
+
+    return col_codes, key_codes, col_unique_vals
+
+
+def _categorical_codes(column):
+    """Get unique values of categorical column in order of ``Series.unique`` and positions in them
+
+    Only integer codes of categorical are processed, categories can be in any order.
+    """
+    cat_codes = column.cat.codes.to_numpy()
+    order = pd.unique(cat_codes)
+
+    vals = np.asarray(pd.Categorical.from_codes(order, dtype=column.dtype))
+
+    # the last cell is for code -1 of missing value
+    lookup = np.full(len(column.cat.categories) + 1, -1, dtype=np.int64)
+    lookup[order] = np.arange(len(order))
+
+    codes = lookup[cat_codes]
+    codes[cat_codes == -1] = -1
+
+    return vals, codes
+
+
+def _product_groups(col_codes, col_unique_vals):
+    """Enumerate groups as cartesian product of unique column values
+
+    Returns flat group id of every row (-1 if row has missing values)
+    and position of every group in unique values of each column.
+    """
+    missing = np.zeros(len(col_codes[0]), dtype=bool)
+    for codes in col_codes:
+        missing |= codes < 0
+
+    dims = [len(vals) for vals in col_unique_vals]
+    group_ids = np.ravel_multi_index([np.where(missing, 0, codes) for codes in col_codes], dims)
+    group_ids[missing] = -1
+
+    positions = np.unravel_index(np.arange(int(np.prod(dims))), dims)
+
+    return group_ids, positions
+
+
+def _observed_groups(col_codes, key_codes):
+    """Enumerate only groups present in rows or in keys, ordered as in cartesian product
+
+    Returns the same as ``_product_groups``.
+    """
+    codes = np.column_stack(col_codes)
+    known = (codes >= 0).all(axis=1)
+
+    if len(key_codes) > 0:
+        codes = np.vstack([codes[known], np.column_stack(key_codes)])
+    else:
+        codes = codes[known]
+
+    # np.unique sorts combinations lexicographically: the first column changes slowest as in it.product
+    combinations, inverse = np.unique(codes, axis=0, return_inverse=True)
+
+    group_ids = np.full(len(known), -1, dtype=np.int64)
+    group_ids[known] = inverse.reshape(-1)[:known.sum()]
+
+    positions = tuple(combinations[:, i] for i in range(combinations.shape[1]))
+
+    return group_ids, positions
+
+
+def _day_numbers(updated, base_date):
+    """Convert dates to number of days since base_date, missing dates become -1"""
+    if pd.api.types.is_integer_dtype(updated):
+        days = updated.to_numpy(dtype=np.int64)
+
+        return np.where(days == _MISSING_DAY, -1, days - (pd.Timestamp(base_date) - _EPOCH).days)
+
+    days = (pd.to_datetime(updated) - pd.Timestamp(base_date)).dt.days
+
+    return days.fillna(-1).to_numpy(dtype=np.int64)
+
+
+def _to_epoch_days(dates):
+    days = (pd.to_datetime(dates) - _EPOCH).dt.days
+
+    return days.fillna(_MISSING_DAY).to_numpy(dtype=np.int32)
+
+
+def _from_epoch_days(days):
+    days = days.to_numpy(dtype=np.int64)
+
+    return pd.Series(
+        np.where(days == _MISSING_DAY, np.datetime64('NaT'), _EPOCH.to_datetime64() + days.astype('timedelta64[D]')),
+        dtype='datetime64[ns]'
+    )
+
+
+def _interval_index(updated, start_date, num_of_intervals, num_of_interval_days):
+    """Bin every row into interval index by ``updated`` date
+
+    Interval i covers days [start + i * k, start + (i + 1) * k] inclusive on both sides,
+    so a row updated on the border of two intervals belongs to both of them
+    and is returned twice: once per interval.
+    """
+    days = _day_numbers(updated, start_date)
+
+    interval = days // num_of_interval_days
+
+    in_period = (days >= 0) & (days <= num_of_intervals * num_of_interval_days)
+    own = in_period & (interval < num_of_intervals)
+    border = in_period & (days % num_of_interval_days == 0) & (interval > 0)
+
+    rows = np.concatenate([np.flatnonzero(own), np.flatnonzero(border)])
+    intervals = np.concatenate([interval[own], interval[border] - 1])
+
+    return rows, intervals
+
+
+def _count_matrix(group_ids, intervals, ids, num_of_groups, num_of_intervals):
+    """Count unique task ids per group per interval as matrix groups × intervals"""
+    counts = np.zeros((num_of_groups, num_of_intervals), dtype=np.int64)
+
+    known = group_ids >= 0
+    nunique = pd.DataFrame({
+        'group': group_ids[known],
+        'interval': intervals[known],
+        'id': ids[known]
+    }).groupby(['group', 'interval']).id.nunique()
+
+    counts[nunique.index.get_level_values('group'), nunique.index.get_level_values('interval')] = nunique.to_numpy()
+
+    return counts
+
+
+def _cumulative_counts(group, day, weights, num_of_groups, num_of_days):
+    """Sum weights (1 by default) per group per day and accumulate them along days into matrix groups × (days + 1)"""
+    daily = np.bincount(group * num_of_days + day, weights=weights, minlength=num_of_groups * num_of_days)
+
+    cumulative = np.zeros((num_of_groups, num_of_days + 1), dtype=np.int64)
+    cumulative[:, 1:] = daily.astype(np.int64).reshape(num_of_groups, num_of_days).cumsum(axis=1)
+
+    return cumulative
+
+
+def _day_cube(group_ids, days, ids, num_of_groups, num_of_days):
+    """Precompute cumulative per group per day counts of unique task ids
+
+    Returns matrix groups × (days + 1) of cumulative counts and repeats of the same task in the same group
+    on several days as (group, previous day, next day) arrays, repeats are used to count such task once per interval.
+    """
+    known = (group_ids >= 0) & (days >= 0) & (days < num_of_days)
+
+    triples = pd.DataFrame({
+        'group': group_ids[known],
+        'id': pd.factorize(ids[known])[0],
+        'day': days[known]
+    }).drop_duplicates().sort_values(['group', 'id', 'day'])
+
+    group = triples.group.to_numpy()
+    task = triples.id.to_numpy()
+    day = triples.day.to_numpy()
+
+    cumulative = _cumulative_counts(group, day, None, num_of_groups, num_of_days)
+
+    same = (group[1:] == group[:-1]) & (task[1:] == task[:-1])
+    repeats = (group[1:][same], day[:-1][same], day[1:][same])
+
+    return cumulative, repeats
+
+
+def _window_count_matrix(cumulative, repeats, first_day, num_of_intervals, num_of_interval_days):
+    """Count unique task ids per group per interval of one window by day cube
+
+    Gives the same matrix groups × intervals as ``_count_matrix`` for the same window.
+    """
+    starts = first_day + num_of_interval_days * np.arange(num_of_intervals)
+    ends = starts + num_of_interval_days
+
+    counts = cumulative[:, ends + 1] - cumulative[:, starts]
+
+    # task repeated on two days of the same interval is counted twice by cumulative sums,
+    # the only interval which can contain both days is the interval of the previous day
+    group, prev_day, next_day = repeats
+    interval = (prev_day - first_day) // num_of_interval_days
+
+    inside = (prev_day >= first_day) & (interval < num_of_intervals) & \
+             (next_day <= first_day + (interval + 1) * num_of_interval_days)
+
+    np.subtract.at(counts, (group[inside], interval[inside]), 1)
+
+    return counts
+
+
+def _window_configs(windows, end_dates, num_of_all_days, num_of_interval_days):
+    """Merge windows and end_dates into list of full window configs"""
+    windows = [] if windows is None else list(windows)
+
+    if end_dates is not None:
+        windows = windows + [{'end_date': end_date} for end_date in end_dates]
+
+    defaults = {'num_of_all_days': num_of_all_days, 'num_of_interval_days': num_of_interval_days}
+    windows = [{**defaults, **window} for window in windows]
+
+    for window in windows:
+        window['end_date'] = pd.Timestamp(window['end_date']).strftime('%Y-%m-%d')
+
+    return windows
+
+
+def _window_days(windows):
+    """Get first date of every window, number of its intervals and range of days covering all windows"""
+    first_dates = [_start_date(w['end_date'], w['num_of_all_days']) for w in windows]
+    num_of_intervals = [int(w['num_of_all_days'] / w['num_of_interval_days']) for w in windows]
+    last_dates = [
+        first_date + dt.timedelta(days=n * w['num_of_interval_days'])
+        for first_date, n, w in zip(first_dates, num_of_intervals, windows)
+    ]
+
+    base_date = min(first_dates, default=dt.date.today())
+    num_of_days = (max(last_dates, default=base_date) - base_date).days + 1
+
+    return first_dates, num_of_intervals, base_date, num_of_days
+
+
+def _score_windows(windows, columns_list, positions, col_unique_vals, cumulative, repeats):
+    """Calculate scores of every window by day cube and stack them into long format dataframe"""
+    first_dates, num_of_intervals, base_date, _ = _window_days(windows)
+
+    window_dfs = []
+    for first_date, n, window in zip(first_dates, num_of_intervals, windows):
+        counts = _window_count_matrix(
+            cumulative, repeats, (first_date - base_date).days, n, window['num_of_interval_days'])
+
+        data = _score_matrix(counts)
+
+        for column, vals, pos in zip(columns_list, col_unique_vals, positions):
+            data[column] = vals[pos]
+
+        for key in ['end_date', 'num_of_all_days', 'num_of_interval_days']:
+            data[key] = window[key]
+
+        window_dfs.append(pd.DataFrame(data=data))
+
+    return pd.concat(window_dfs, ignore_index=True) if len(window_dfs) > 0 else None
+
+
+def _round_builtin(values, ndigits):
+    return np.array([round(value, ndigits) for value in values.tolist()], dtype=np.float64)
+
+
+def _score_matrix(counts):
+    """Calculate workload score for every row of matrix groups × intervals
+
+    Repeats rounding of legacy engine step by step to give bit-for-bit identical values.
+    """
+    num_of_intervals = counts.shape[1]
+
+    history = counts[:, :-1]
+    current = counts[:, -1]
+
+    avg = np.round(history.mean(axis=1), 2)
+
+    x_values = np.round((history - avg[:, None]) ** 2, 2)
+
+    # summation in the same order as built-in sum
+    x_sum = np.zeros(len(counts))
+    for i in range(x_values.shape[1]):
+        x_sum = x_sum + x_values[:, i]
+    x_sum = np.round(x_sum, 2)
+
+    var = np.round(x_sum / (num_of_intervals - 1), 2)
+
+    # legacy engine rounds std and ste as python floats, which is correctly rounded
+    # and sometimes differs from np.round, e.g. round(5.865, 2) = 5.87 while np.round gives 5.86
+    std = _round_builtin(np.sqrt(var), 2)
+    ste = _round_builtin(std / mt.sqrt(num_of_intervals), 2)
+
+    left_border = np.trunc(avg - ste).astype(np.int64)
+    right_border = np.trunc(avg + ste).astype(np.int64)
+
+    score_value = np.select(
+        [
+            (left_border == 0) & (current == 0) & (right_border == 0),
+            (current >= 0) & (current < left_border),
+            (current >= left_border) & (current <= right_border)
+        ],
+        [0, 0, 1],
+        default=2
+    )
+
+    return {
+        'score_value': score_value,
+        'count_last_period': current,
+        'count_sem_calc_period': ste,
+        'count_mean_calc_period': avg
+    }
+
+
+def _score_partition(shm_name, num_of_entries, start, end, groups, num_of_intervals):
+    """Count and score groups of one partition by its slice of entries (group, interval, id) at shared memory"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    try:
+        view = np.ndarray((3, num_of_entries), dtype=np.int64, buffer=shm.buf)
+        entries = view[:, start:end].copy()
+        del view
+    finally:
+        shm.close()
+
+    counts = _count_matrix(np.searchsorted(groups, entries[0]), entries[1], entries[2], len(groups), num_of_intervals)
+
+    return _score_matrix(counts)
+
+
+def _score_partitions(group_ids, intervals, ids, first_positions, num_of_intervals, n_jobs):
+    """Score groups by process pool, groups are partitioned by hash of position of the first column value
+
+    Returns the same as ``_score_matrix`` with groups in the same order.
+    """
+    num_of_groups = len(first_positions)
+
+    known = group_ids >= 0
+    entries = np.vstack([group_ids[known], intervals[known], pd.factorize(ids[known])[0]]).astype(np.int64)
+
+    # multiplicative hash spreads neighbour codes between partitions
+    group_partitions = (first_positions.astype(np.uint64) * np.uint64(2654435761) % np.uint64(2 ** 32)) % n_jobs
+    group_partitions = group_partitions.astype(np.int64)
+
+    entry_partitions = group_partitions[entries[0]]
+    order = np.argsort(entry_partitions, kind='stable')
+    entries = entries[:, order]
+    bounds = np.searchsorted(entry_partitions[order], np.arange(n_jobs + 1))
+
+    partition_groups = [np.flatnonzero(group_partitions == p) for p in range(n_jobs)]
+
+    shm = shared_memory.SharedMemory(create=True, size=max(entries.nbytes, 1))
+
+    try:
+        view = np.ndarray(entries.shape, dtype=np.int64, buffer=shm.buf)
+        view[:] = entries
+        del view
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [
+                executor.submit(_score_partition, shm.name, entries.shape[1], bounds[p], bounds[p + 1],
+                                partition_groups[p], num_of_intervals)
+                for p in range(n_jobs)
+            ]
+
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    data = {}
+    for groups, result in zip(partition_groups, results):
+        for key, values in result.items():
+            if key not in data:
+                data[key] = np.zeros(num_of_groups, dtype=values.dtype)
+
+            data[key][groups] = values
+
+    return data
+
+
+class _IntervalCounter:
+    """Fold chunks of records into per group per interval counts of unique task ids
+
+    Keeps unique values of grouping columns, observed combinations of them, counts per group per interval
+    and 64-bit hashes of counted (group, interval, id) to count task once if it's met in several chunks.
+    Records out of the period are dropped right away, so memory doesn't depend on their number.
+    With assume_unique_ids hashes are not kept and memory is bounded by groups × intervals.
+    """
+
+    def __init__(self, columns_list, start_date, num_of_intervals, num_of_interval_days, assume_unique_ids=False):
+        self.columns_list = columns_list
+        self.start_date = start_date
+        self.num_of_intervals = num_of_intervals
+        self.num_of_interval_days = num_of_interval_days
+        self.assume_unique_ids = assume_unique_ids
+
+        self.col_unique_vals = [None] * len(columns_list)
+        self.combinations = np.zeros((0, len(columns_list)), dtype=np.int64)
+        self.counts = None
+        # set inserts are amortized O(1), sorted array would be re-sorted by every chunk
+        self.seen = set()
+
+    def add(self, chunk):
+        col_codes = []
+        for i, column in enumerate(self.columns_list):
+            vals = chunk[column].unique()
+
+            if self.col_unique_vals[i] is not None:
+                vals = pd.concat([pd.Series(self.col_unique_vals[i]), pd.Series(vals)], ignore_index=True).unique()
+
+            # codes of known values never change because new values are appended to the end
+            codes = pd.Index(vals).get_indexer(chunk[column])
+            codes[chunk[column].isna().to_numpy()] = -1
+
+            self.col_unique_vals[i] = vals
+            col_codes.append(codes)
+
+        codes = np.column_stack(col_codes).astype(np.int64) if len(col_codes) > 0 else np.zeros((len(chunk), 0))
+        known = (codes >= 0).all(axis=1)
+
+        self.combinations = np.unique(np.vstack([self.combinations, codes[known]]), axis=0)
+
+        rows, intervals = _interval_index(chunk.updated, self.start_date, self.num_of_intervals,
+                                          self.num_of_interval_days)
+        rows, intervals = rows[known[rows]], intervals[known[rows]]
+
+        entries = pd.DataFrame(codes[rows], columns=self.columns_list)
+        entries['interval'] = intervals
+        entries['id'] = chunk.id.to_numpy()[rows]
+        entries = entries.drop_duplicates()
+
+        if not self.assume_unique_ids:
+            hashes = pd.util.hash_pandas_object(entries, index=False).to_numpy().tolist()
+
+            # entries are unique inside chunk, so only hashes of previous chunks are checked
+            entries = entries[np.fromiter((h not in self.seen for h in hashes), dtype=bool, count=len(hashes))]
+            self.seen.update(hashes)
+
+        chunk_counts = entries.groupby(self.columns_list + ['interval']).size()
+
+        self.counts = chunk_counts if self.counts is None else self.counts.add(chunk_counts, fill_value=0)
+
+    def result(self, sparse=False, zero_activity_keys=None):
+        """Get matrix groups × intervals of counts, positions of groups in unique values and unique values"""
+        col_unique_vals = [np.array([]) if vals is None else vals for vals in self.col_unique_vals]
+        key_codes = []
+
+        if zero_activity_keys is not None:
+            for i, column in enumerate(self.columns_list):
+                keys = zero_activity_keys[column]
+
+                col_unique_vals[i] = pd.concat([pd.Series(col_unique_vals[i]), keys], ignore_index=True).unique()
+                key_codes.append(pd.Index(col_unique_vals[i]).get_indexer(keys))
+
+        if self.counts is None or len(self.counts) == 0:
+            entry_codes = [np.array([], dtype=np.int64) for _ in self.columns_list]
+            intervals = np.array([], dtype=np.int64)
+            values = np.array([], dtype=np.int64)
+        else:
+            index = self.counts.index
+            entry_codes = [index.get_level_values(c).to_numpy(dtype=np.int64) for c in self.columns_list]
+            intervals = index.get_level_values('interval').to_numpy(dtype=np.int64)
+            values = self.counts.to_numpy(dtype=np.int64)
+
+        if sparse:
+            # entries are subset of observed combinations, so they don't add new groups
+            col_codes = [np.concatenate([self.combinations[:, i], codes]) for i, codes in enumerate(entry_codes)]
+            group_ids, positions = _observed_groups(col_codes, key_codes)
+            group_ids = group_ids[len(self.combinations):]
+        else:
+            group_ids, positions = _product_groups(entry_codes, col_unique_vals)
+
+        counts = np.zeros((len(positions[0]), self.num_of_intervals), dtype=np.int64)
+        counts[group_ids, intervals] = values
+
+        return counts, positions, col_unique_vals
 
 
 class WorkloadScoring:
     """Class to calculate workload scoring based on BigQuery.
     """
 
-    def __init__(self, credentials):
+    def __init__(self, credentials=None, cache=None, backend=None):
         """
 
         Parameters
         ----------
-        credentials: dict of str: str, required
+        credentials: dict of str: str, optional, default=None
             required fields: https://google-auth.readthedocs.io/en/latest/user-guide.html
+            required if backend is None
+        cache: QueryCache, optional, default=None
+            local cache of ``read_table`` results, None means every call queries BigQuery
+        backend: DataBackend, optional, default=None
+            backend to read source table and write results e.g. ``CsvBackend`` for local exports,
+            None means ``BigQueryBackend`` with credentials
 
         Attributes
         ----------
@@ -71,17 +594,37 @@ class WorkloadScoring:
             result of score calculation for saving in BigQuery table
         project_id: dataframe
             GCP project_id where placed BigQuery dataset and tables
+        num_of_pruned_combinations: int
+            number of combinations of column values skipped by last sparse scoring
+        cache: QueryCache
+            local cache of ``read_table`` results
+        backend: DataBackend
+            backend to read source table and write results
+        column_types: dict of (str, str): dict of str: dtype
+            cached dtypes of destination tables columns by (dataset_id, table_id)
+        write_queue: dict of (str, str): list of dataframe
+            results queued by ``write_table`` to be written by ``flush_tables``
 
         """
 
         self.raw_df = None
         self.out_df = None
 
-        self.project_id = credentials['project_id']
+        self.num_of_pruned_combinations = 0
 
-        self.credentials = Credentials.from_service_account_info(credentials)
+        self.cache = cache
 
-    def workload_scoring(self, columns_list, num_of_all_days=28, num_of_interval_days=7, end_date='2017-04-01'):
+        self.backend = BigQueryBackend(credentials) if backend is None else backend
+
+        self.column_types = {}
+        self.write_queue = {}
+
+        self.project_id = getattr(self.backend, 'project_id', None)
+
+        self.credentials = getattr(self.backend, 'credentials', None)
+
+    def workload_scoring(self, columns_list, num_of_all_days=28, num_of_interval_days=7, end_date='2017-04-01',
+                         engine='vectorized', sparse=False, zero_activity_keys=None, n_jobs=1):
         """Method for calculation workload scoring based on historical data
 
         Parameters
@@ -94,12 +637,23 @@ class WorkloadScoring:
             window that used to slide against period
         end_date: str, optional, default='2017-04-01'
             date of the last interval in schema 'y-m-d'
+        engine: str, optional, default='vectorized'
+            'vectorized' – bin every row into its interval once and count tasks by single groupby
+            'legacy' – original loop over cartesian product, kept to verify scores of vectorized engine
+        sparse: bool, optional, default=False
+            score only combinations of column values present in raw_df instead of full cartesian product,
+            number of skipped combinations is stored at ``num_of_pruned_combinations``
+        zero_activity_keys: dataframe or list of tuples, optional, default=None
+            combinations of column values (in order of columns_list) to score in sparse mode
+            even if they have no records in raw_df e.g. all assignees of the team
+        n_jobs: int, optional, default=1
+            number of processes to score partitions of groups by 'vectorized' engine, -1 means all cores
 
 
         Notes
         ----------
 
-        Algorithm explanation
+        Algorithm explanation (legacy engine, vectorized engine gives identical out_df)
 
         1) Calculate cartesian product unique values in each columns
 
@@ -150,11 +704,96 @@ class WorkloadScoring:
 
             2 < 2.53 –> 0
 
+        Vectorized engine does the same in three steps:
+
+        1) Convert ``updated`` to interval index once, rows on the border of two intervals go to both of them
+
+        2) Count unique tasks by single ``groupby(group + interval).id.nunique()`` into matrix groups × intervals
+
+        3) Calculate mean, var, std, ste and score for all groups at once as numpy column operations
+
+        Sparse mode replaces cartesian product on step 1 of legacy algorithm by combinations
+        which have records in raw_df (plus zero_activity_keys), so for example with columns
+
+        - assignee_id: [1, 2, 3]
+        - country: ['usa', 'russia']
+
+        where only assignee 1 worked with russia the output is
+
+            combinations = [(1, 'usa'), (1, 'russia'), (2, 'usa'), (3, 'usa')]
+
+        and 2 combinations are pruned. Scores of remaining combinations equal to scores of full product.
+
+        With n_jobs > 1 groups are partitioned by hash of the first column value (e.g. assignee_id),
+        records of all partitions are placed to shared memory as integer arrays (group, interval, id)
+        and every partition is counted and scored by its own process. Row order of out_df doesn't depend on n_jobs.
+
         """
 
         if self.raw_df is None:
             return 'load data'
 
+        if engine == 'vectorized':
+            self.out_df = self.__workload_scoring_vectorized(
+                columns_list, num_of_all_days, num_of_interval_days, end_date, sparse, zero_activity_keys, n_jobs)
+        elif sparse or n_jobs != 1:
+            raise ValueError("sparse and parallel scoring are supported by 'vectorized' engine only")
+        elif engine == 'legacy':
+            self.num_of_pruned_combinations = 0
+            self.out_df = self.__workload_scoring_legacy(
+                columns_list, num_of_all_days, num_of_interval_days, end_date)
+        else:
+            raise ValueError(f"unknown engine '{engine}', expected 'vectorized' or 'legacy'")
+
+    def __workload_scoring_vectorized(self, columns_list, num_of_all_days, num_of_interval_days, end_date,
+                                      sparse=False, zero_activity_keys=None, n_jobs=1):
+        start_date = _start_date(end_date, num_of_all_days)
+        num_of_intervals = int(num_of_all_days / num_of_interval_days)
+
+        group_ids, positions, col_unique_vals = self.__group_codes(
+            self.raw_df, columns_list, sparse, zero_activity_keys)
+
+        rows, intervals = _interval_index(self.raw_df.updated, start_date, num_of_intervals, num_of_interval_days)
+
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+
+        if n_jobs > 1:
+            data = _score_partitions(group_ids[rows], intervals, self.raw_df.id.to_numpy()[rows],
+                                     positions[0], num_of_intervals, n_jobs)
+        else:
+            counts = _count_matrix(group_ids[rows], intervals, self.raw_df.id.to_numpy()[rows],
+                                   len(positions[0]), num_of_intervals)
+
+            data = _score_matrix(counts)
+
+        for column, vals, pos in zip(columns_list, col_unique_vals, positions):
+            data[column] = vals[pos]
+
+        return pd.DataFrame(data=data)
+
+    def __group_codes(self, df, columns_list, sparse, zero_activity_keys):
+        if zero_activity_keys is not None:
+            zero_activity_keys = pd.DataFrame(zero_activity_keys, columns=columns_list)
+
+        col_codes, key_codes, col_unique_vals = _column_codes(df, columns_list, zero_activity_keys)
+
+        if sparse:
+            group_ids, positions = _observed_groups(col_codes, key_codes)
+        else:
+            group_ids, positions = _product_groups(col_codes, col_unique_vals)
+
+        self.num_of_pruned_combinations = mt.prod(len(vals) for vals in col_unique_vals) - len(positions[0])
+
+        return group_ids, positions, col_unique_vals
+
+    def __workload_scoring_legacy(self, columns_list, num_of_all_days, num_of_interval_days, end_date):
+        raw_df = self.raw_df
+
+        # legacy engine compares dates as strings
+        if pd.api.types.is_integer_dtype(raw_df.updated):
+            raw_df = raw_df.assign(updated=_from_epoch_days(raw_df.updated).to_numpy())
+
         data = {
             'score_value': [],
             'count_last_period': [],
@@ -166,12 +805,12 @@ class WorkloadScoring:
         for column in columns_list:
             data[column] = []
 
-            col_unique_vals.append(self.raw_df[column].unique())
+            col_unique_vals.append(raw_df[column].unique())
 
         cartesian_product = list(it.product(*col_unique_vals))
 
         for values in cartesian_product:
-            df_slice = self.__get_dataframe_slice(columns_list, values)
+            df_slice = self.__get_dataframe_slice(raw_df, columns_list, values)
 
             end_date = dt.datetime.strptime(str(end_date), '%Y-%m-%d')
             end_date = end_date.date()
@@ -225,9 +864,192 @@ class WorkloadScoring:
             for i, column in enumerate(columns_list):
                 data[column].append(values[i])
 
-        self.out_df = pd.DataFrame(data=data)
+        return pd.DataFrame(data=data)
+
+    def workload_scoring_batch(self, columns_list, windows=None, end_dates=None, num_of_all_days=28,
+                               num_of_interval_days=7, sparse=False, zero_activity_keys=None):
+        """Method for calculation workload scoring for several windows by single pass over historical data
+
+        Parameters
+        ----------
+        columns_list: list of str, required
+            columns for grouping records e.g. group by column1, column2 etc.
+        windows: list of dict, optional, default=None
+            window configs with keys num_of_all_days, num_of_interval_days, end_date
+            as in ``workload_scoring``, missing keys are taken from parameters below
+        end_dates: list of str, optional, default=None
+            end dates in schema 'y-m-d' e.g. for backfill, each one is added to windows
+            with num_of_all_days and num_of_interval_days from parameters below
+        num_of_all_days: int, optional, default=28
+            period in days that used to calculate score
+        num_of_interval_days: int, optional, default=7
+            window that used to slide against period
+        sparse: bool, optional, default=False
+            the same as in ``workload_scoring``
+        zero_activity_keys: dataframe or list of tuples, optional, default=None
+            the same as in ``workload_scoring``
+
+        Notes
+        ----------
+
+        out_df has long format: rows of every window are stacked and marked by columns
+        end_date, num_of_all_days, num_of_interval_days. Scores of every window are equal to scores
+        of ``workload_scoring`` with the same config.
+
+        Algorithm explanation
+
+        1) Count unique tasks per group per day once for the whole range of all windows
+
+        2) Calculate cumulative sums of daily counts along days
+
+        3) For every window get count per interval as difference of cumulative sums on the interval borders,
+        tasks updated on several days of the same interval are subtracted to be counted once
+
+        4) Calculate scores for every window as in ``workload_scoring``
+
+        Example for 90 days backfill:
+
+            $ ws.workload_scoring_batch(['assignee_id'], end_dates=pd.date_range('2017-01-01', '2017-03-31'))
+
+        """
+
+        if self.raw_df is None:
+            return 'load data'
+
+        windows = _window_configs(windows, end_dates, num_of_all_days, num_of_interval_days)
+
+        group_ids, positions, col_unique_vals = self.__group_codes(
+            self.raw_df, columns_list, sparse, zero_activity_keys)
+
+        _, _, base_date, num_of_days = _window_days(windows)
+
+        cumulative, repeats = _day_cube(group_ids, _day_numbers(self.raw_df.updated, base_date),
+                                        self.raw_df.id.to_numpy(), len(positions[0]), num_of_days)
+
+        self.out_df = _score_windows(windows, columns_list, positions, col_unique_vals, cumulative, repeats)
+
+    def workload_scoring_incremental(self, store_path, dataset_id, table_id, columns, windows=None, end_dates=None,
+                                     num_of_all_days=28, num_of_interval_days=7, sparse=False,
+                                     zero_activity_keys=None):
+        """Method for calculation workload scoring by persisted daily counts updated with new records only
+
+        Parameters
+        ----------
+        store_path: str, required
+            path to SQLite file of ``DailyCountStore``, it's created on the first run
+        dataset_id: str, required
+            BigQuery dataset_id of dataset that contains tables
+        table_id: str, required
+            BigQuery table_id which use to query data
+        columns: dict of str: list of obj, required
+            columns for grouping records as in ``read_table``, the same columns must be used with the same store
+        windows, end_dates, num_of_all_days, num_of_interval_days, sparse, zero_activity_keys: optional
+            the same as in ``workload_scoring_batch``
+
+        Notes
+        ----------
+
+        Algorithm explanation
+
+        1) Read from BigQuery only records updated since the last day in store (the whole table on the first run)
+
+        2) Merge new records into store: every task is moved from its previous group and day to the new ones
+
+        3) Calculate scores of all windows by stored daily counts as in ``workload_scoring_batch``
+
+        After the first run every run reads one day of data, raw_df contains only these new records.
+        Scores are equal to ``workload_scoring_batch`` over the whole table while the table has one record per task.
+        Task which doesn't pass filters of columns after update keeps its previous group and day in store.
 
-    def read_table(self, dataset_id, table_id, columns):
+        """
+        columns_list = list(columns.keys())
+        windows = _window_configs(windows, end_dates, num_of_all_days, num_of_interval_days)
+        _, _, base_date, num_of_days = _window_days(windows)
+
+        with DailyCountStore(store_path, columns_list) as store:
+            # delta since watermark is read bypassing cache: cached delta of previous run within ttl
+            # would skip new records forever because watermark moves forward after merge
+            self.read_table(dataset_id, table_id, columns, updated_since=store.watermark(), compact=False,
+                            use_cache=False)
+            store.merge(self.raw_df)
+
+            daily_df = store.read_daily_counts(since=base_date)
+
+        group_ids, positions, col_unique_vals = self.__group_codes(
+            daily_df, columns_list, sparse, zero_activity_keys)
+
+        days = _day_numbers(daily_df.day, base_date)
+        known = (group_ids >= 0) & (days >= 0) & (days < num_of_days)
+
+        cumulative = _cumulative_counts(group_ids[known], days[known], daily_df.num_of_tasks.to_numpy()[known],
+                                        len(positions[0]), num_of_days)
+
+        # every task has the only day in store, so there are no repeats to subtract
+        repeats = (np.array([], dtype=np.int64),) * 3
+
+        self.out_df = _score_windows(windows, columns_list, positions, col_unique_vals, cumulative, repeats)
+
+    def workload_scoring_stream(self, dataset_id, table_id, columns, num_of_all_days=28, num_of_interval_days=7,
+                                end_date='2017-04-01', sparse=False, zero_activity_keys=None, chunksize=100000,
+                                assume_unique_ids=False):
+        """Method for calculation workload scoring by reading table by chunks without loading it to raw_df
+
+        Parameters
+        ----------
+        dataset_id: str, required
+            BigQuery dataset_id of dataset that contains tables
+        table_id: str, required
+            BigQuery table_id which use to query data
+        columns: dict of str: list of obj, required
+            columns for grouping records as in ``read_table``
+        num_of_all_days, num_of_interval_days, end_date, sparse, zero_activity_keys: optional
+            the same as in ``workload_scoring``
+        chunksize: int, optional, default=100000
+            number of rows read at once
+        assume_unique_ids: bool, optional, default=False
+            True if table has one record per task, then ids aren't tracked between chunks
+            and memory is bounded by number of groups × intervals
+
+        Notes
+        ----------
+
+        Every chunk is folded into per group per interval counts of unique tasks and dropped,
+        so peak memory is bounded by one chunk plus counts instead of the whole table.
+        Rows of out_df are equal to rows of ``workload_scoring`` over the same records, but ordered by
+        key columns, because unique values come in order of chunks instead of order of the whole table.
+        raw_df isn't changed, so it can be scored by other methods after, read results aren't cached.
+
+        """
+
+        columns_list = list(columns.keys())
+
+        counter = _IntervalCounter(
+            columns_list,
+            _start_date(end_date, num_of_all_days),
+            int(num_of_all_days / num_of_interval_days),
+            num_of_interval_days,
+            assume_unique_ids
+        )
+
+        for chunk in self.backend.read_chunks(dataset_id, table_id, columns, chunksize=chunksize):
+            counter.add(chunk)
+
+        if zero_activity_keys is not None:
+            zero_activity_keys = pd.DataFrame(zero_activity_keys, columns=columns_list)
+
+        counts, positions, col_unique_vals = counter.result(sparse, zero_activity_keys)
+
+        self.num_of_pruned_combinations = mt.prod(len(vals) for vals in col_unique_vals) - len(positions[0])
+
+        data = _score_matrix(counts)
+
+        for column, vals, pos in zip(columns_list, col_unique_vals, positions):
+            data[column] = vals[pos]
+
+        self.out_df = pd.DataFrame(data=data).sort_values(columns_list, kind='stable').reset_index(drop=True)
+
+    def read_table(self, dataset_id, table_id, columns, updated_since=None, table_modified=None, compact=False,
+                   use_cache=True):
         """Loading table data from BigQuery for workload scoring model
 
         Parameters
@@ -238,6 +1060,14 @@ class WorkloadScoring:
             BigQuery table_id which use to query data
         columns: list of dict of str: list of obj, required
             columns for grouping records e.g. group by column1, column2 etc.
+        updated_since: str, optional, default=None
+            read only records updated since this date in schema 'y-m-d' (inclusive)
+        table_modified: str, optional, default=None
+            last modification time of the table, cached results of other modification time are not used
+        compact: bool, optional, default=False
+            convert raw_df to compact representation by ``compact_raw_df`` after reading
+        use_cache: bool, optional, default=True
+            False means records are read from backend and not cached even if cache is set
 
         Notes
         ----------
@@ -295,34 +1125,69 @@ class WorkloadScoring:
             3       2017-01-01  2017-04-03  2               usa
 
         """
-        where_statement = []
-        from_statement = f"from `{dataset_id}.{table_id}`"
-        select_statement = "select id, date(cast(created_at as datetime)) as created, " \
-                           "date(cast(updated_at as datetime)) as updated"
-
-        if columns is not None:
-            select_statement = select_statement + ", " + ", ".join(columns.keys())
-
-            for c, v in columns.items():
-                if len(v) > 0:
-                    val_enum = ", ".join([f"'{x}'" for x in v])
-                    where_statement.append(f'{c} in ({val_enum})')
-
-        where_statement = "where " + ", ".join(where_statement) if len(where_statement) > 0 else ""
-
-        bigquery_sql = " ".join([
-            select_statement,
-            from_statement,
-            where_statement,
-            "ORDER BY updated"
-        ])
-
-        self.raw_df = pandas_gbq.read_gbq(
-            bigquery_sql,
-            project_id=self.project_id
-        )
+        query = self.backend.query(dataset_id, table_id, columns, updated_since)
+
+        self.raw_df = None
+
+        cache = self.cache if use_cache else None
+
+        if cache is not None:
+            self.raw_df = cache.get(query, dataset_id, table_id, columns, updated_since, table_modified,
+                                         source=self.backend.cache_key(dataset_id, table_id))
+
+        if self.raw_df is None:
+            self.raw_df = self.backend.read(dataset_id, table_id, columns, updated_since)
+
+            if cache is not None:
+                cache.put(self.raw_df, query, dataset_id, table_id, columns, updated_since, table_modified,
+                               source=self.backend.cache_key(dataset_id, table_id))
+
+        if compact:
+            self.compact_raw_df()
 
-    def write_table(self, dataset_id, table_id, dev_name='default.developer', columns=None):
+    def compact_raw_df(self):
+        """Convert raw_df to compact representation for scoring
+
+        Notes
+        ----------
+
+        - id – integer codes of unique ids (original ids are not kept)
+        - created, updated – int32 number of days since 1970-01-01
+        - other columns – categorical with categories in order of appearance
+
+        All scoring methods work with compact raw_df and give the same out_df,
+        vectorized engines compare only integer codes and day numbers.
+
+        Example:
+
+            id      created     updated     assignee_id             id  created  updated  assignee_id
+            a1      2017-01-01  2017-04-02  1               –>      0   17167    17258    1 (code 0)
+            b7      2017-01-01  2017-04-03  1                       1   17167    17259    1 (code 0)
+
+        """
+
+        if self.raw_df is None:
+            return 'load data'
+
+        compact_df = pd.DataFrame(index=self.raw_df.index)
+
+        for column in self.raw_df.columns:
+            values = self.raw_df[column]
+
+            if column == 'id':
+                codes, _ = pd.factorize(values)
+                compact_df[column] = codes.astype(np.int32 if len(codes) < np.iinfo(np.int32).max else np.int64)
+            elif column in ('created', 'updated'):
+                compact_df[column] = values if pd.api.types.is_integer_dtype(values) else _to_epoch_days(values)
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                compact_df[column] = values
+            else:
+                compact_df[column] = pd.Categorical(values, categories=pd.unique(values.dropna()))
+
+        self.raw_df = compact_df
+
+    def write_table(self, dataset_id, table_id, dev_name='default.developer', columns=None, queue=False,
+                    chunksize=None):
         """Writing scoring data to BigQuery table
 
         Parameters
@@ -335,10 +1200,16 @@ class WorkloadScoring:
             name.surname of developer who perform calculations
         columns: list of str, optional, default=None
             columns to use in resulting table
+        queue: bool, optional, default=False
+            queue result to write it later by ``flush_tables`` with other results of the same table by one load
+        chunksize: int, optional, default=None
+            number of rows per load for very large results, None means one load
 
         Notes
         ----------
 
+        Dtypes of destination columns are requested once per table and cached at ``column_types``.
+
         Example
 
         Input parameters:
@@ -367,38 +1238,77 @@ class WorkloadScoring:
         if self.out_df is None:
             return 'calc workload scoring'
 
-        destination_table = f"{dataset_id}.{table_id}"
-
         insert_df = pd.DataFrame()
 
         if columns is None:
             columns = self.out_df.columns
 
-        column2type = dict(pandas_gbq.read_gbq(
-            f"select {', '.join(columns)} from `{destination_table}` limit 0",
-            project_id=self.project_id
-        ).dtypes)
+        column2type = self.__column_types(dataset_id, table_id, columns)
 
         for col in columns:
-            insert_df[col] = self.out_df[col].astype(column2type[col])
+            insert_df[col] = self.out_df[col] if column2type is None else self.out_df[col].astype(column2type[col])
 
         insert_df['developer'] = dev_name
         insert_df['developer'] = insert_df['developer'].astype('str')
 
-        pandas_gbq.to_gbq(
-            insert_df,
-            project_id=self.project_id,
-            destination_table=destination_table,
-            if_exists='append'
-        )
+        if queue:
+            self.write_queue.setdefault((dataset_id, table_id), []).append(insert_df)
+        else:
+            self.backend.write(insert_df, dataset_id, table_id, chunksize)
 
-    def __get_dataframe_slice(self, columns, values):
+    def flush_tables(self, chunksize=None):
+        """Writing all queued results, results of the same table are written by one load
+
+        Parameters
+        ----------
+        chunksize: int, optional, default=None
+            number of rows per load for very large results, None means one load per table
+
+        Example
+        ----------
+
+            $ ws.write_table(dataset_id, 'score_result_status', developer_name, queue=True)
+            $ ws.write_table(dataset_id, 'score_result_status', developer_name, queue=True)
+            $ ws.write_table(dataset_id, 'score_result_total', developer_name, queue=True)
+
+            $ ws.flush_tables()  # 2 loads instead of 3
+
+        """
+
+        while len(self.write_queue) > 0:
+            (dataset_id, table_id), insert_dfs = next(iter(self.write_queue.items()))
+
+            self.backend.write(pd.concat(insert_dfs, ignore_index=True), dataset_id, table_id, chunksize)
+
+            # table is removed from queue only after successful write to retry failed ones
+            del self.write_queue[(dataset_id, table_id)]
+
+    def __column_types(self, dataset_id, table_id, columns):
+        destination = (dataset_id, table_id)
+        cached = self.column_types.get(destination, {})
+
+        missing = [col for col in columns if col not in cached]
+
+        if len(missing) > 0:
+            column2type = self.backend.column_types(dataset_id, table_id, missing)
+
+            # backend without fixed schema
+            if column2type is None:
+                return None
+
+            cached = {**cached, **column2type}
+            self.column_types[destination] = cached
+
+        return cached
+
+    @staticmethod
+    def __get_dataframe_slice(df, columns, values):
         mask = True
 
         for i, col in enumerate(columns):
-            mask = mask & (self.raw_df[col] == values[i])
+            mask = mask & (df[col] == values[i])
 
-        return self.raw_df[mask]
+        return df[mask]
 
     @staticmethod
     def __calc_workload_score(left_board, right_board, current_num_of_tasks):
@@ -0,0 +1,249 @@
+"""
+This module provides class QueryCache to store results of ``WorkloadScoring.read_table`` at local Parquet files.
+
+Supported features:
+
+- content-addressed entries: key is hash of query, dataset, table and optional table-modified timestamp
+- time to live of entries
+- size limit of cache with eviction of least recently used entries
+- serving request for narrower columns and filters from wider cached result
+
+Notes
+-----
+
+[!] Library uses pyarrow to read and write Parquet files.
+
+Cache directory contains Parquet file per entry and ``index.json`` with description of every entry.
+
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+
+class QueryCache:
+    """Class to cache query results at local Parquet files
+    """
+
+    index_file = 'index.json'
+
+    def __init__(self, path, ttl=None, max_size=None):
+        """
+
+        Parameters
+        ----------
+        path: str, required
+            directory to store cache, it's created if not exists
+        ttl: int, optional, default=None
+            time to live of entry in seconds, None means entries never expire
+        max_size: int, optional, default=None
+            max total size of Parquet files in bytes, None means no limit
+
+        Attributes
+        ----------
+        entries : dict of str: dict
+            description of every entry by its key: dataset, table, columns, query time and size
+
+        """
+
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        index_path = os.path.join(path, self.index_file)
+
+        self.entries = {}
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.entries = json.load(f)
+
+    def get(self, sql, dataset_id, table_id, columns, updated_since=None, table_modified=None, source=None):
+        """Get cached query result by exact query or by cached result of wider query
+
+        Parameters
+        ----------
+        sql: str, required
+            query generated by ``read_table``
+        dataset_id: str, required
+            BigQuery dataset_id of queried table
+        table_id: str, required
+            BigQuery table_id of queried table
+        columns: dict of str: list of obj, required
+            columns and filters as in ``read_table``
+        updated_since: str, optional, default=None
+            filter of updated date as in ``read_table``
+        table_modified: str, optional, default=None
+            last modification time of the table, entries of other modification time are not used
+        source: str, optional, default=None
+            backend type and location of the table (see ``DataBackend.cache_key``),
+            entries read from other source are not used
+
+        Returns
+        -------
+        df
+            query result or None if cache has no suitable entry
+
+        Notes
+        ----------
+
+        Wider entry can serve request if it has the same source, dataset, table and table_modified,
+        all requested columns, every requested filter is narrower than entry's one (empty filter is the widest),
+        columns out of request are not filtered and updated_since isn't later than requested.
+
+        Example:
+
+            cached  – {'assignee_id': [], 'status': [], 'channel': []}
+            request – {'assignee_id': [], 'status': ['closed', 'solved']}
+
+        Result is cached dataframe with rows where status in ('closed', 'solved') without channel column.
+
+        """
+
+        self.__evict_expired()
+
+        key = _entry_key(sql, dataset_id, table_id, table_modified, source)
+
+        if key in self.entries:
+            return self.__read_entry(key)
+
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['size']):
+            if _is_wider(entry, dataset_id, table_id, columns, updated_since, table_modified, source):
+                return _narrow(self.__read_entry(key), columns, updated_since)
+
+        return None
+
+    def put(self, df, sql, dataset_id, table_id, columns, updated_since=None, table_modified=None, source=None):
+        """Store query result, parameters are the same as in ``get``"""
+
+        key = _entry_key(sql, dataset_id, table_id, table_modified, source)
+        file_path = os.path.join(self.path, f'{key}.parquet')
+
+        df.to_parquet(file_path, index=False)
+
+        now = time.time()
+        self.entries[key] = {
+            'source': source,
+            'dataset_id': dataset_id,
+            'table_id': table_id,
+            'columns': {c: [str(x) for x in v] for c, v in (columns or {}).items()},
+            'updated_since': None if updated_since is None else str(updated_since),
+            'table_modified': None if table_modified is None else str(table_modified),
+            'created': now,
+            'accessed': now,
+            'size': os.path.getsize(file_path)
+        }
+
+        self.__evict_expired()
+        self.__evict_least_recently_used()
+        self.__save_index()
+
+    def clear(self):
+        for key in list(self.entries):
+            self.__remove_entry(key)
+
+        self.__save_index()
+
+    def __read_entry(self, key):
+        self.entries[key]['accessed'] = time.time()
+        self.__save_index()
+
+        return pd.read_parquet(os.path.join(self.path, f'{key}.parquet'))
+
+    def __evict_expired(self):
+        if self.ttl is None:
+            return
+
+        now = time.time()
+        expired = [key for key, entry in self.entries.items() if now - entry['created'] > self.ttl]
+
+        for key in expired:
+            self.__remove_entry(key)
+
+        if len(expired) > 0:
+            self.__save_index()
+
+    def __evict_least_recently_used(self):
+        if self.max_size is None:
+            return
+
+        total_size = sum(entry['size'] for entry in self.entries.values())
+
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]['accessed']):
+            if total_size <= self.max_size:
+                break
+
+            total_size -= entry['size']
+            self.__remove_entry(key)
+
+    def __remove_entry(self, key):
+        file_path = os.path.join(self.path, f'{key}.parquet')
+
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+        del self.entries[key]
+
+    def __save_index(self):
+        index_path = os.path.join(self.path, self.index_file)
+
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(self.entries, f)
+
+        os.replace(index_path + '.tmp', index_path)
+
+
+def _entry_key(sql, dataset_id, table_id, table_modified, source=None):
+    # the same query of other source e.g. other BigQuery project is other entry, keys without source are kept
+    content = json.dumps([sql, dataset_id, table_id, None if table_modified is None else str(table_modified)]
+                         + ([] if source is None else [source]))
+
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _is_wider(entry, dataset_id, table_id, columns, updated_since, table_modified, source=None):
+    """Check entry contains all rows and columns requested by columns and updated_since"""
+    columns = {c: [str(x) for x in v] for c, v in (columns or {}).items()}
+    table_modified = None if table_modified is None else str(table_modified)
+
+    # entries of index written before source was stored have no source and serve exact queries only
+    if entry.get('source') != source:
+        return False
+
+    if (entry['dataset_id'], entry['table_id'], entry['table_modified']) != (dataset_id, table_id, table_modified):
+        return False
+
+    if entry['updated_since'] is not None:
+        if updated_since is None or str(updated_since) < entry['updated_since']:
+            return False
+
+    for c, cached_values in entry['columns'].items():
+        if len(cached_values) == 0:
+            continue
+
+        if c not in columns or len(columns[c]) == 0 or not set(columns[c]) <= set(cached_values):
+            return False
+
+    return set(columns) <= set(entry['columns'])
+
+
+def _narrow(df, columns, updated_since):
+    """Apply filters of request to result of wider query"""
+    columns = columns or {}
+
+    mask = pd.Series(True, index=df.index)
+
+    for c, v in columns.items():
+        if len(v) > 0:
+            mask &= df[c].astype(str).isin([str(x) for x in v])
+
+    if updated_since is not None:
+        mask &= pd.to_datetime(df.updated) >= pd.Timestamp(updated_since)
+
+    return df.loc[mask, ['id', 'created', 'updated'] + list(columns)].reset_index(drop=True)
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backends import CsvBackend
+from lib import WorkloadScoring
+from query_cache import QueryCache
+
+columns = {'assignee_id': [], 'channel': []}
+columns_list = list(columns)
+
+end_date = '2017-03-20'
+
+
+def make_table(num_of_rows=3000, unique_ids=False, seed=0):
+    """Source table of backends: id, created_at, updated_at and grouping columns"""
+    rng = np.random.default_rng(seed)
+    updated = pd.Timestamp('2017-01-20') + pd.to_timedelta(rng.integers(0, 60, num_of_rows), unit='D')
+
+    return pd.DataFrame({
+        'id': np.arange(num_of_rows) if unique_ids else rng.integers(0, num_of_rows // 3, num_of_rows),
+        'created_at': updated.strftime('%Y-%m-%d'),
+        'updated_at': updated.strftime('%Y-%m-%d'),
+        # assignee 9 works with email only, so sparse mode prunes its other combinations
+        'assignee_id': rng.integers(0, 10, num_of_rows),
+        'channel': rng.choice(['email', 'chat', 'phone'], num_of_rows),
+    }).assign(channel=lambda df: df.channel.where(df.assignee_id != 9, 'email'))
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = CsvBackend(str(tmp_path))
+
+    backend.write(make_table(), 'ds', 'tasks')
+    backend.write(make_table(unique_ids=True, seed=1), 'ds', 'unique_tasks')
+
+    return backend
+
+
+def score(backend, table_id, compact=False, **kwargs):
+    ws = WorkloadScoring(backend=backend)
+    ws.read_table('ds', table_id, columns, compact=compact)
+    ws.workload_scoring(columns_list, **kwargs)
+
+    return ws.out_df
+
+
+def assert_equal_scores(out_df, legacy_df):
+    """Compare scores of the same groups regardless of row order"""
+    out_df = out_df.sort_values(columns_list).reset_index(drop=True)
+    legacy_df = legacy_df.sort_values(columns_list).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(out_df[legacy_df.columns], legacy_df, check_dtype=False)
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'compact': True},
+    {'n_jobs': 2},
+    {'n_jobs': 2, 'compact': True},
+])
+def test_vectorized_engine_equals_legacy(backend, options):
+    legacy_df = score(backend, 'tasks', num_of_all_days=35, end_date=end_date, engine='legacy')
+
+    # legacy engine gives rows in order of cartesian product, vectorized engine keeps it
+    pd.testing.assert_frame_equal(
+        score(backend, 'tasks', num_of_all_days=35, end_date=end_date, **options), legacy_df, check_dtype=False)
+
+
+def test_sparse_engine_equals_legacy_without_pruned_combinations(backend):
+    legacy_df = score(backend, 'tasks', num_of_all_days=35, end_date=end_date, engine='legacy')
+
+    ws = WorkloadScoring(backend=backend)
+    ws.read_table('ds', 'tasks', columns)
+    ws.workload_scoring(columns_list, num_of_all_days=35, end_date=end_date, sparse=True,
+                        zero_activity_keys=[(9, 'chat')])
+
+    observed = ws.raw_df[columns_list].drop_duplicates()
+    observed = pd.concat([observed, pd.DataFrame([(9, 'chat')], columns=columns_list)])
+
+    assert ws.num_of_pruned_combinations == len(legacy_df) - len(observed) > 0
+    assert_equal_scores(ws.out_df, legacy_df.merge(observed, on=columns_list))
+
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('assume_unique_ids', [False, True])
+def test_stream_equals_legacy(backend, sparse, assume_unique_ids):
+    # the same task in several chunks is counted once unless ids are assumed unique
+    table_id = 'unique_tasks' if assume_unique_ids else 'tasks'
+    legacy_df = score(backend, table_id, num_of_all_days=35, end_date=end_date, engine='legacy')
+
+    ws = WorkloadScoring(backend=backend)
+    ws.workload_scoring_stream('ds', table_id, columns, num_of_all_days=35, end_date=end_date, sparse=sparse,
+                               chunksize=700, assume_unique_ids=assume_unique_ids)
+
+    if sparse:
+        observed = backend.read('ds', table_id, columns)[columns_list].drop_duplicates()
+        legacy_df = legacy_df.merge(observed, on=columns_list)
+
+    assert_equal_scores(ws.out_df, legacy_df)
+
+
+def windows_equal_legacy(backend, table_id, out_df, windows):
+    for window in windows:
+        legacy_df = score(backend, table_id, engine='legacy', **window)
+
+        window_df = out_df[
+            (pd.to_datetime(out_df.end_date) == pd.Timestamp(window['end_date']))
+            & (out_df.num_of_all_days == window['num_of_all_days'])
+            & (out_df.num_of_interval_days == window['num_of_interval_days'])
+        ]
+
+        assert len(window_df) == len(legacy_df)
+        assert_equal_scores(window_df, legacy_df)
+
+
+batch_windows = [
+    {'num_of_all_days': 28, 'num_of_interval_days': 7, 'end_date': '2017-03-01'},
+    {'num_of_all_days': 35, 'num_of_interval_days': 7, 'end_date': end_date},
+    {'num_of_all_days': 30, 'num_of_interval_days': 10, 'end_date': '2017-03-10'},
+]
+
+
+def test_batch_equals_legacy(backend):
+    ws = WorkloadScoring(backend=backend)
+    ws.read_table('ds', 'tasks', columns)
+    ws.workload_scoring_batch(columns_list, windows=batch_windows)
+
+    windows_equal_legacy(backend, 'tasks', ws.out_df, batch_windows)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_incremental_equals_legacy(backend, tmp_path, cached):
+    # store keeps the last record of every task, so table has one record per task
+    source = make_table(unique_ids=True, seed=1)
+    store_path = str(tmp_path / 'store.sqlite')
+
+    cache = QueryCache(str(tmp_path / 'cache')) if cached else None
+    ws = WorkloadScoring(backend=CsvBackend(str(tmp_path / 'incremental')), cache=cache)
+
+    # records arrive by runs, every run reads records since the last stored day only,
+    # the last two runs read since the same day, so the last one must not get result of the previous one
+    day = source.updated_at == '2017-02-14'
+    runs = [
+        source.updated_at < '2017-02-14',
+        day & (source.id % 2 == 0),
+        day & (source.id % 2 == 1),
+        source.updated_at > '2017-02-14',
+    ]
+
+    for rows in runs:
+        ws.backend.write(source[rows], 'ds', 'tasks')
+        ws.workload_scoring_incremental(store_path, 'ds', 'tasks', columns, windows=batch_windows)
+
+    windows_equal_legacy(backend, 'unique_tasks', ws.out_df, batch_windows)